@@ -0,0 +1,331 @@
+"""
+Benchmarks of sphinxcontrib.autojs on synthetic JavaScript sources
+~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+It generates JavaScript files of several shapes and sizes, times finding their
+docstrings, rendering them under each ``:member-order:``, lexing a ``jscon``
+session and a full ``sphinx-build`` of a sample project, measures the import
+time of the extension, and compares the timings with a stored baseline:
+
+.. sourcecode:: console
+
+    $ python bench/bench_autojs.py
+    $ python bench/bench_autojs.py --save
+    $ python bench/bench_autojs.py --only flat --sizes 100,1000
+
+It exits with status 1 when a timing is slower than the baseline by more than
+the tolerance. The baseline depends on the machine, so save one before
+comparing a change.
+"""
+from __future__ import print_function
+
+import argparse
+import json
+import os
+import os.path
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+try:
+    from time import perf_counter as timer
+except ImportError:
+    from time import time as timer
+
+import sphinx
+from sphinxcontrib.autojs import JavaScriptDocument, \
+                                 JavascriptConsoleLexer, ALL
+
+
+BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                        "baseline.json")
+SIZES = [100, 1000, 10000, 50000]
+MEMBER_ORDERS = ["alphabetical", "groupwise", "bysource"]
+#: Timings shorter than this are too noisy to count as regressions.
+MIN_TIME = 0.001
+
+
+def make_flat(size):
+    """Classes of nine members each: methods, static methods, attributes and
+    members, in source order.
+    """
+    lines = []
+    for i in range(size // 10 or 1):
+        cls = "Class%d" % i
+        lines.append("var %s = function( a, b ) {\n"
+                     "    /**class:%s( a, b )\n\n"
+                     "    The class number %d.\n"
+                     "    */\n"
+                     "};" % (cls, cls, i))
+        for j in range(9):
+            if j % 3 == 0:
+                sig = "%s.prototype.method%d( x )" % (cls, j)
+            elif j % 3 == 1:
+                sig = "%s.static%d( y )" % (cls, j)
+            else:
+                sig = "%s.prototype.attr%d" % (cls, j)
+            lines.append("/**:%s\n\n"
+                         "The member %d of ``%s``, which does something.\n"
+                         "*/\n"
+                         "%s = null;" % (sig, j, cls, sig.split("(")[0]))
+    return "\n".join(lines) + "\n"
+
+
+def make_nested(size, depth=20):
+    """Chains of ``depth`` prototypes, each nested in the previous one."""
+    lines = []
+    for i in range(size // depth or 1):
+        name = "Root%d" % i
+        for level in range(depth):
+            if level:
+                name = "%s.prototype.level%d" % (name, level)
+            lines.append("/**:%s\n\nThe level %d.\n*/" % (name, level))
+    return "\n".join(lines) + "\n"
+
+
+def make_doctests(size, examples=5):
+    """Functions whose docstrings have many examples and code blocks."""
+    lines = []
+    for i in range(size):
+        body = ["/**:func%d( n )" % i, "", "The function %d." % i]
+        for j in range(examples):
+            body.extend(["", "    >>> func%d( %d );" % (i, j),
+                         "    %d" % (i * j),
+                         "", "Some code::", "",
+                         "    var x = func%d( %d ) / 2;" % (i, j)])
+        body.append("*/")
+        lines.append("\n".join(body))
+        lines.append("function func%d( n ) { return n * %d; }" % (i, i))
+    return "\n".join(lines) + "\n"
+
+
+def make_unterminated(size):
+    """Openers of docstrings which are never closed, in code, strings and
+    regular expressions, after a few valid docstrings.
+    """
+    lines = ["/**:valid%d\n\nA valid docstring.\n*/" % i for i in range(10)]
+    for i in range(size):
+        lines.append("var s%d = '/**:not.a.docstring%d', r = /\\/**/;"
+                     % (i, i))
+    lines.append("/**:unterminated%d( a )\n\nNever closed." % size)
+    lines.extend("var x%d = %d;" % (i, i) for i in range(size))
+    return "\n".join(lines) + "\n"
+
+
+CORPORA = [("flat", make_flat), ("nested", make_nested),
+           ("doctests", make_doctests), ("unterminated", make_unterminated)]
+
+
+def make_session(size):
+    """A ``jscon`` session of examples with continuation lines, comments and
+    template literals, and their outputs.
+    """
+    lines = []
+    for i in range(size):
+        lines.append(">>> var x%d = $( 'div' ).find( /item-%d/g ) / 2;"
+                     % (i, i))
+        if i % 3 == 0:
+            lines.extend(["... /* spans\n... lines */ + `template ${ x%d }" % i,
+                          "... text`.length;"])
+        lines.append("%d" % i)
+        if i % 5 == 0:
+            lines.extend([">>> throw new Error( 'no %d' );" % i,
+                          "Error: no %d" % i])
+    return "\n".join(lines) + "\n"
+
+
+def bench_lexer(size, repeat):
+    """Times the tokens of a ``jscon`` session of ``size`` examples."""
+    text = make_session(size)
+    lexer = JavascriptConsoleLexer()
+    return {"jscon.%d.lex" % size: best_of(
+        repeat, lambda: list(lexer.get_tokens(text)))}
+
+
+def best_of(repeat, func):
+    best = None
+    for i in range(repeat):
+        start = timer()
+        func()
+        elapsed = timer() - start
+        if best is None or elapsed < best:
+            best = elapsed
+    return best
+
+
+def bench_file(name, path, repeat):
+    results = {}
+    document = JavaScriptDocument(path)
+    document.source
+    results[name + ".get_docstrings"] = best_of(
+        repeat, lambda: list(document.get_docstrings()))
+    document.parse()
+    for member_order in MEMBER_ORDERS:
+        options = {"members": ALL, "member-order": member_order}
+        results["%s.to_rst.%s" % (name, member_order)] = best_of(
+            repeat, lambda: document.to_rst(options))
+    return results
+
+
+CONF_PY = """\
+extensions = ["sphinxcontrib.autojs"]
+master_doc = "index"
+autojs_cache = False
+"""
+
+
+def bench_build(dirname, repeat):
+    """Times ``sphinx-build`` of a project over a flat and a doctest corpus,
+    with and without ``autojs_render_nodes``.
+    """
+    results = {}
+    srcdir = os.path.join(dirname, "project")
+    os.mkdir(srcdir)
+    with open(os.path.join(srcdir, "conf.py"), "w") as f:
+        f.write(CONF_PY)
+    with open(os.path.join(srcdir, "flat.js"), "w") as f:
+        f.write(make_flat(1000))
+    with open(os.path.join(srcdir, "doctests.js"), "w") as f:
+        f.write(make_doctests(200))
+    with open(os.path.join(srcdir, "index.rst"), "w") as f:
+        f.write("Sample\n======\n\n.. autojs:: flat.js\n\n"
+                ".. autojs:: doctests.js\n")
+    outdir = os.path.join(dirname, "build")
+    for name, render_nodes in [("sphinx-build", 0),
+                               ("sphinx-build.render_nodes", 1)]:
+        command = [sys.executable, "-m", "sphinx", "-E", "-q",
+                   "-b", "pseudoxml", "-D",
+                   "autojs_render_nodes=%d" % render_nodes, srcdir, outdir]
+        # the paths of autojs are relative to the working directory
+        results[name] = best_of(repeat, lambda: subprocess.check_call(
+            command, cwd=srcdir))
+    return results
+
+
+IMPORT_CODE = "import sphinx.application; import sphinxcontrib.autojs"
+
+
+def bench_import(repeat):
+    """Measures the cumulative import time of ``sphinxcontrib.autojs`` with
+    ``-X importtime`` (Python 3.7+), after the modules that a Sphinx build
+    always imports.
+    """
+    if sys.version_info < (3, 7):
+        return {}
+    command = [sys.executable, "-X", "importtime", "-c", IMPORT_CODE]
+    env = dict(os.environ)
+    # the compilation of the source is not part of it
+    env.pop("PYTHONDONTWRITEBYTECODE", None)
+    best = None
+    for i in range(repeat + 1):
+        output = subprocess.check_output(command, env=env,
+                                         stderr=subprocess.STDOUT)
+        elapsed = None
+        for line in output.decode("utf-8").splitlines():
+            fields = [field.strip() for field in line.split("|")]
+            if len(fields) == 3 and fields[2] == "sphinxcontrib.autojs":
+                elapsed = int(fields[1]) / 1e6
+        # the first run writes the bytecode
+        if i and elapsed is not None and (best is None or elapsed < best):
+            best = elapsed
+    return {"import": best}
+
+
+def run(sizes, only, repeat, build):
+    results = {}
+    dirname = tempfile.mkdtemp(prefix="autojs-bench-")
+    try:
+        for corpus, make in CORPORA:
+            if only and corpus not in only:
+                continue
+            for size in sizes:
+                path = os.path.join(dirname, "%s-%d.js" % (corpus, size))
+                with open(path, "w") as f:
+                    f.write(make(size))
+                name = "%s.%d" % (corpus, size)
+                print("benchmarking %s..." % name, file=sys.stderr)
+                results.update(bench_file(name, path, repeat))
+        if not only or "jscon" in only:
+            for size in sizes:
+                print("benchmarking jscon.%d..." % size, file=sys.stderr)
+                results.update(bench_lexer(size, repeat))
+        if build:
+            print("benchmarking sphinx-build...", file=sys.stderr)
+            results.update(bench_build(dirname, repeat))
+        print("benchmarking the import...", file=sys.stderr)
+        results.update(bench_import(repeat))
+    finally:
+        shutil.rmtree(dirname)
+    return results
+
+
+def compare(results, baseline, tolerance):
+    """Prints the timings next to the baseline and returns the names of the
+    ones slower than it by more than ``tolerance``.
+    """
+    regressions = []
+    print("%-40s %10s %10s %8s" % ("benchmark", "baseline", "current",
+                                   "ratio"))
+    for name in sorted(results):
+        current = results[name]
+        if name not in baseline:
+            print("%-40s %10s %10.4f %8s" % (name, "-", current, "-"))
+            continue
+        ratio = current / baseline[name] if baseline[name] else 1.0
+        mark = ""
+        if ratio > 1 + tolerance and current >= MIN_TIME:
+            regressions.append(name)
+            mark = " !"
+        print("%-40s %10.4f %10.4f %7.2fx%s" % (name, baseline[name],
+                                                current, ratio, mark))
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("--sizes", default=",".join(map(str, SIZES)),
+                        help="the numbers of docstrings "
+                             "(default: %(default)s)")
+    parser.add_argument("--only", default="",
+                        help="the corpora to run, separated by commas, "
+                             "and jscon for the lexer")
+    parser.add_argument("--repeat", type=int, default=3,
+                        help="the best of how many runs (default: 3)")
+    parser.add_argument("--no-build", dest="build", action="store_false",
+                        help="skip the sphinx-build benchmark")
+    parser.add_argument("--baseline", default=BASELINE,
+                        help="the baseline file "
+                             "(default: bench/baseline.json)")
+    parser.add_argument("--tolerance", type=float, default=0.25,
+                        help="the allowed slowdown (default: 0.25)")
+    parser.add_argument("--save", action="store_true",
+                        help="store the timings as the baseline")
+    args = parser.parse_args(argv)
+    sizes = [int(size) for size in args.sizes.split(",")]
+    only = [corpus for corpus in args.only.split(",") if corpus]
+    results = run(sizes, only, args.repeat, args.build)
+    if args.save:
+        with open(args.baseline, "w") as f:
+            json.dump({"python": platform.python_version(),
+                       "platform": platform.platform(),
+                       "sphinx": sphinx.__version__,
+                       "results": results}, f, indent=2, sort_keys=True)
+            f.write("\n")
+        print("saved %d timings to %s" % (len(results), args.baseline))
+        return 0
+    try:
+        with open(args.baseline) as f:
+            baseline = json.load(f)["results"]
+    except (IOError, OSError, ValueError):
+        baseline = {}
+    regressions = compare(results, baseline, args.tolerance)
+    if regressions:
+        print("%d benchmarks are slower than the baseline: %s"
+              % (len(regressions), ", ".join(regressions)))
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -17,7 +17,7 @@ Links
 """
 from setuptools import setup, find_packages
 
-requires = ['Sphinx>=0.6']
+requires = ['Sphinx>=1.6']
 
 setup(
     name='sphinxcontrib-autojs',
@@ -46,4 +46,9 @@ setup(
     include_package_data=True,
     install_requires=requires,
     namespace_packages=['sphinxcontrib'],
+    entry_points={
+        'console_scripts': [
+            'autojs-precompile = sphinxcontrib.autojs:main',
+        ],
+    },
 )
@@ -1,16 +1,44 @@
-import functools
+import bisect
+import glob
+import hashlib
+import itertools
+import json
+import mmap
 import os
 import os.path
 import re
+import subprocess
+import time
+try:
+    from sys import intern
+except ImportError:
+    pass
+from collections import OrderedDict
+from contextlib import contextmanager
+try:
+    import cPickle as pickle
+except ImportError:
+    import pickle
+try:
+    from time import perf_counter as timer
+except ImportError:
+    from time import time as timer
 from docutils import nodes
+from docutils.parsers.rst import Directive, directives
 from docutils.statemachine import ViewList
-from pygments.lexers import JavascriptLexer, LEXERS
-from pygments.token import *
+import pygments
+from pygments.lexers.javascript import JavascriptLexer
+from pygments.token import Generic, Name
 from sphinx import addnodes
-from sphinx.domains.javascript import *
-from sphinx.util.compat import Directive
+from sphinx.builders import Builder
+from sphinx.domains.javascript import JSCallable, JSConstructor, JSObject, \
+                                      JSXRefRole
+from sphinx.errors import SphinxError
+from sphinx.util import logging
 from sphinx.util.nodes import nested_parse_with_titles
-from sphinx.ext.autodoc import members_option, bool_option, identity, ALL
+
+
+logger = logging.getLogger(__name__)
 
 
 # for docstrings
@@ -21,11 +49,80 @@ CONTINUED = "... "
 
 
 def text_indent(indent, text):
-    return re.compile("^", re.MULTILINE).sub(indent, text)
+    if not indent:
+        return text
+    return indent + text.replace("\n", "\n" + indent)
 
 
 def text_outdent(indent, text):
-    return re.compile("^" + re.escape(indent), re.MULTILINE).sub("", text)
+    if not indent:
+        return text
+    size = len(indent)
+    return "\n".join(line[size:] if line.startswith(indent) else line
+                     for line in text.split("\n"))
+
+
+def hash_text(text):
+    if isinstance(text, type(u"")):
+        text = text.encode("utf-8")
+    return hashlib.sha1(text).hexdigest()
+
+
+#: The value of ``:members:`` without an argument, which selects all members.
+ALL = object()
+
+
+def members_option(arg):
+    """Converts ``:members:`` and ``:exclude-members:`` as
+    :mod:`sphinx.ext.autodoc` does, without importing it.
+    """
+    if arg is None:
+        return ALL
+    return [x.strip() for x in arg.split(",")]
+
+
+def bool_option(arg):
+    return True
+
+
+def member_order_option(arg):
+    """Converts ``:member-order:``, so that an unknown order is reported as
+    an error of the directive.
+    """
+    return directives.choice(arg, ("alphabetical", "groupwise", "bysource"))
+
+
+def options_key(options):
+    """Returns a hashable and picklable key of the :class:`AutoJavaScript`
+    options. :data:`ALL` becomes ``True``.
+    """
+    def freeze(members):
+        if members is ALL:
+            return True
+        elif members is not None:
+            return tuple(members)
+    return (bool(options.get("exclude-desc")), freeze(options.get("members")),
+            freeze(options.get("exclude-members")), options.get("member-order"),
+            options.get("symbol"))
+
+
+def options_from_key(key):
+    options = {}
+    exclude_desc, members, exclude_members, member_order = key[:4]
+    # the records of older builds have no symbol
+    symbol = key[4] if len(key) > 4 else None
+    for option, value in [("exclude-desc", exclude_desc or None),
+                          ("members", members),
+                          ("exclude-members", exclude_members),
+                          ("member-order", member_order),
+                          ("symbol", symbol)]:
+        if value is True:
+            value = ALL
+        elif isinstance(value, tuple):
+            value = list(value)
+        if value is not None:
+            options[option] = value
+    return options
 
 
 class JavascriptConsoleLexer(JavascriptLexer):
@@ -38,6 +135,10 @@ class JavascriptConsoleLexer(JavascriptLexer):
         foo
         >>> 1 / 0;
         Infinity
+
+    The session is split at the ``>>>`` prompts first. Only the examples,
+    with their ``...`` lines, go through the Javascript lexer and each output
+    is a single token.
     """
 
     name = "Javascript console session"
@@ -46,7 +147,7 @@ class JavascriptConsoleLexer(JavascriptLexer):
                      (r"\$|jQuery|MooTools|Class|Browser|Array|Function" \
                       r"String|Hash|Event|Element|JSON|Cookie|Fx|Request",
                       Name.Class)]
-    EXCEPTIONS = ["Error", "KeyError", "HTTPError", "ReferenceError"]
+    EXCEPTIONS = set(["Error", "KeyError", "HTTPError", "ReferenceError"])
     tokens = JavascriptLexer.tokens.copy()
     tokens["root"] = CONSOLE_RULES + tokens["root"][:]
     aliases = ["jscon"]
@@ -54,21 +155,46 @@ class JavascriptConsoleLexer(JavascriptLexer):
     filenames = []
     alias_filenames = []
 
+    _PROMPT_RE = re.compile(r"^>>>(?= )", re.MULTILINE)
+    #: An example with its ``...`` lines and the whitespace after it, which
+    #: the Javascript lexer reads as one token with the last newline.
+    _EXAMPLE_RE = re.compile(r">>>(?= )[^\n]*(?:\n\.\.\.(?= )[^\n]*)*\n?\s*")
+
     def get_tokens_unprocessed(self, text):
+        starts = [match.start() for match in self._PROMPT_RE.finditer(text)]
+        if not starts or starts[0]:
+            starts.insert(0, 0)
+        ends = starts[1:] + [len(text)]
+        for start, end in zip(starts, ends):
+            for item in self.get_example_tokens(text, start, end):
+                yield item
+
+    def get_example_tokens(self, text, start, end):
+        """Yields the tokens of the text between a prompt and the next one.
+        The example and its ``...`` lines are lexed together, so a comment or
+        a literal may span them, and the rest of the text is the output.
+        """
+        match = self._EXAMPLE_RE.match(text, start, end)
+        example_end = end if match is None else match.end()
         is_example = False
         is_output = False
-        for item in JavascriptLexer.get_tokens_unprocessed(self, text):
-            if item[1] is Generic.Prompt:
+        exceptions = self.EXCEPTIONS
+        lex = JavascriptLexer.get_tokens_unprocessed
+        for index, token, value in lex(self, text[start:example_end]):
+            index += start
+            if token is Generic.Prompt:
                 is_example = True
                 is_output = False
-            elif is_example and item[2].endswith(u"\n"):
+            elif is_example and value.endswith(u"\n"):
                 is_example = False
                 is_output = True
             elif is_output:
-                item = item[0], Generic.Output, item[2]
-            elif item[2] in self.EXCEPTIONS:
-                item = item[0], Name.Exception, item[2]
-            yield item
+                token = Generic.Output
+            elif value in exceptions:
+                token = Name.Exception
+            yield index, token, value
+        if example_end < end:
+            yield example_end, Generic.Output, text[example_end:end]
 
 
 class JSClassmember(JSObject):
@@ -97,31 +223,86 @@ class JSClassmember(JSObject):
         return name_prefix + "."
 
 
-# Holds a last signed class name
-def before_js_constructor(self):
-    super(JSConstructor, self).before_content()
-    if self.names:
-        self.env.temp_data['js:class'] = self.names[0][0]
-JSConstructor.before_content = before_js_constructor
+class JSClassConstructor(JSConstructor):
 
-# Adds js:method directive and js:meth role
-JavaScriptDomain.directives.update({"member": JSClassmember,
-                                    "attribute": JSClassmember,
-                                    "method": JSClassmember,
-                                    "staticmethod": JSClassmember})
-JavaScriptDomain.roles.update({"meth": JSXRefRole(fix_parens=True)})
+    def before_content(self):
+        # Holds a last signed class name
+        super(JSClassConstructor, self).before_content()
+        if self.names:
+            self.env.temp_data["js:class"] = self.names[0][0]
 
 
 class JavaScriptDocstring(object):
+    """A named docstring or the description of a JavaScript file. The body of
+    a parsed docstring is kept as the ``(start, end)`` span of its text in the
+    source of ``document``, and it is rewritten into reStructuredText only
+    when :attr:`body` is first used. Only the span is pickled.
+    """
+
+    __slots__ = ("indent", "name", "sig", "directive", "offset", "start",
+                 "end", "document", "_body")
+
+    _INTERACTION_RE = re.compile(r"""
+        \n\s*?\n
+        (?P<codeblock> \s*?
+            (?P<prompt> \>\>\>)
+        )
+    """, re.VERBOSE | re.MULTILINE)
+    _CODEBLOCK_RE = re.compile(r"""
+        ::\s*?\n\s*?\n
+    """, re.VERBOSE | re.MULTILINE)
+    #: The directives which :meth:`rewrite` inserts, with a blank line after
+    #: each one.
+    _DIRECTIVES = (".. sourcecode:: jscon", ".. sourcecode:: js")
 
-    def __init__(self, indent, body, name=None, sig=None, directive=None):
+    def __init__(self, indent, body, name=None, sig=None, directive=None,
+                 offset=None, span=None, document=None):
         self.indent = indent
-        self.body = body
         self.name = name
         self.sig = sig
         self.directive = directive
-        self._member_re = re.compile("^" + re.escape(self.name) + \
-                                     "(?:\.prototype)?\.([^.]+)$")
+        self.offset = offset
+        self.span = span
+        self.document = document
+        self._body = body
+
+    def __getstate__(self):
+        # the document is attached again when the docstring is loaded, and
+        # the body is rewritten again from the span
+        body = self._body if self.start is None else None
+        return (self.indent, self.name, self.sig, self.directive,
+                self.offset, self.start, self.end, body)
+
+    def __setstate__(self, state):
+        (self.indent, self.name, self.sig, self.directive, self.offset,
+         self.start, self.end, self._body) = state
+        self.document = None
+
+    @property
+    def span(self):
+        if self.start is None:
+            return None
+        return self.start, self.end
+
+    @span.setter
+    def span(self, span):
+        # two integers are smaller than a tuple of them
+        self.start, self.end = span or (None, None)
+
+    @property
+    def raw_body(self):
+        """The text of the body as it is in the source."""
+        if self.start is None:
+            return self._body
+        return self.document._decode(self.start, self.end)
+
+    @property
+    def body(self):
+        """The body rewritten into reStructuredText."""
+        if self._body is None:
+            with self.document.timing("rewrite"):
+                self._body = self.rewrite(self.indent, self.raw_body)
+        return self._body
 
     def guess_objtype(self, in_parent=True):
         if self.directive:
@@ -141,53 +322,195 @@ class JavaScriptDocstring(object):
         else:
             return "member"
 
-    def to_rst(self, docstrings=[], indent="", parent=None, is_member=None):
-        rst = []
+    def get_parent_names(self):
+        """Returns the names of the docstrings that could have this docstring
+        as a member, such as ``Foo.prototype`` and ``Foo`` for
+        ``Foo.prototype.bar()``.
+        """
+        if self.directive not in (None, "attribute"):
+            return []
+        prefix, dot, member = self.sig.rpartition(".")
+        if not dot or not member:
+            return []
+        names = [prefix]
+        if prefix.endswith(".prototype"):
+            names.append(prefix[:-len(".prototype")])
+        return names
+
+    def get_subject(self, parent=None):
+        """Returns the ``(objtype, sig)`` to document this docstring as
+        within ``parent``, or ``(None, None)`` if it has no signature.
+        """
+        if not self.sig:
+            return None, None
         in_parent = isinstance(parent, type(self))
-        if self.sig:
-            objtype = self.guess_objtype(in_parent=in_parent)
-            sig = self.sig
-            if in_parent:
-                sig = parent._member_re.sub(r"\1", sig)
-            subject = "\n%s.. js:%s:: %s\n" % (indent, objtype, sig)
-            indent += "   "
-            rst.append(subject)
-        body = text_indent(indent, self.body)
-        rst.append(body)
-        try:
-            if objtype == "class" or not objtype.endswith("method"):
-                included = []
-                members = self.find_members(docstrings, is_member)
-                for i, mem in members:
-                    rst.append(mem.to_rst(docstrings, indent, parent=self))
-                    included.append(i)
-                for i in reversed(included):
-                    del docstrings[i]
-        except NameError:
-            pass
+        objtype = self.guess_objtype(in_parent=in_parent)
+        sig = self.sig
+        if in_parent:
+            # ``Foo.prototype.bar()`` in ``Foo`` is ``bar()``
+            sig = sig.rpartition(".")[2]
+        return objtype, sig
+
+    def find_members(self, index, objtype, is_member=None):
+        """Yields the members to nest in this docstring, marking them
+        included once the caller has documented all of them.
+        """
+        if index is None or objtype is None or \
+           (objtype != "class" and objtype.endswith("method")):
+            return
+        included = []
+        for mem in index.find_members(self, is_member):
+            yield mem
+            included.append(mem)
+        index.included.update(included)
+
+    def to_rst(self, index=None, indent="", parent=None, is_member=None,
+               rendered=None):
+        rst = []
+        for lines, linenos in self.iter_rst(index, indent, parent, is_member,
+                                            rendered, linenos=False):
+            rst.extend(lines)
         return "\n".join(rst)
 
-    def find_members(self, docstrings, is_member=None):
-        _is_member = is_member
-        def is_member(doc):
-            if callable(_is_member) and not _is_member(doc):
-                return False
-            return self._member_re.match(doc.sig)
-        for i, mem in enumerate(docstrings):
-            if mem.directive in (None, "attribute") and is_member(mem):
-                yield i, mem
+    def iter_rst(self, index=None, indent="", parent=None, is_member=None,
+                 rendered=None, linenos=True):
+        """Yields the lines of :meth:`to_rst` as ``(lines, linenos)``, a
+        docstring at a time, with the lines of the source where they come
+        from unless ``linenos`` is false. Then each body is a single item, as
+        :meth:`get_body_lines` returns it.
+        """
+        return self.iter_many_rst([self], index, indent, parent, is_member,
+                                  rendered, linenos)
+
+    @staticmethod
+    def iter_many_rst(docstrings, index=None, indent="", parent=None,
+                      is_member=None, rendered=None, linenos=True):
+        """Yields the chunks of :meth:`iter_rst` of each of ``docstrings`` in
+        turn. The next docstring is requested once the members of the
+        previous one are rendered.
+        """
+        # the docstrings and their members are walked with a stack of their
+        # iterators instead of recursion, so that a chunk is not yielded
+        # again by each parent
+        stack = [(iter(docstrings), indent, parent, is_member)]
+        while stack:
+            docs, indent, parent, is_member = stack[-1]
+            for doc in docs:
+                break
+            else:
+                stack.pop()
+                continue
+            if rendered is not None:
+                rendered.append(doc)
+            objtype, sig = doc.get_subject(parent)
+            if objtype is None:
+                yield doc.get_body_lines(indent, linenos)
+            elif not linenos:
+                subject = "%s.. js:%s:: %s" % (indent, objtype, sig)
+                indent += "   "
+                yield ["", subject, "", text_indent(indent, doc.body)], None
+            else:
+                subject = "%s.. js:%s:: %s" % (indent, objtype, sig)
+                indent += "   "
+                lines, body_linenos = doc.get_body_lines(indent)
+                lines[:0] = ["", subject, ""]
+                body_linenos[:0] = [doc.get_lineno(doc.offset)] * 3
+                yield lines, body_linenos
+            stack.append((doc.find_members(index, objtype, is_member),
+                          indent, doc, None))
+
+    def get_lineno(self, pos):
+        """Returns the line of a position in the source, counted from 0, or
+        ``None`` if the docstring has no document.
+        """
+        if self.document is None or pos is None:
+            return None
+        return self.document.get_lineno(pos) - 1
+
+    def get_body_lines(self, indent="", linenos=True):
+        """Returns the lines of the body, indented, and the lines of the
+        source where they come from. A line which :meth:`rewrite` inserted
+        comes from the next line of the source. Unless ``linenos`` is true,
+        the body is returned as one item, which :meth:`to_rst` joins without
+        splitting it, and ``None``.
+        """
+        body = self.body
+        if not linenos:
+            return [text_indent(indent, body)], None
+        lines = text_indent(indent, body).split("\n")
+        lineno = self.get_lineno(self.start)
+        if lineno is None:
+            return lines, [None] * len(lines)
+        raw_lines = self.raw_body.split("\n")
+        if len(raw_lines) == len(lines):
+            # nothing was inserted
+            return lines, list(range(lineno, lineno + len(lines)))
+        linenos = []
+        # the numbers of lines numbered and inserted so far
+        done = inserted = 0
+        # the line j starts at the position start
+        j = start = 0
+        prefix = "\n" + self._DIRECTIVES[-1]
+        pos = body.find(prefix)
+        while pos >= 0:
+            j += body.count("\n", start, pos + 1)
+            start = pos + 1
+            pos = body.find(prefix, start)
+            end = body.find("\n", start)
+            line = body[start:] if end < 0 else body[start:end]
+            i = j - inserted
+            if line not in self._DIRECTIVES or \
+               i < len(raw_lines) and raw_lines[i].strip() == line:
+                # not a directive or written in the docstring
+                continue
+            linenos.extend(range(lineno + done - inserted, lineno + i))
+            linenos.extend([lineno + i] * 2)
+            done = j + 2
+            inserted += 2
+        linenos.extend(range(lineno + done - inserted,
+                             lineno + len(lines) - inserted))
+        return lines, linenos
+
+    def get_examples(self):
+        """Returns the :class:`JavaScriptExample` of each ``>>>`` prompt in
+        the interactive sessions of the body.
+        """
+        examples = []
+        example = None
+        for lineno, line in enumerate(self.raw_body.split("\n")):
+            stripped = line.lstrip()
+            if stripped.startswith(PROMPT) or stripped == PROMPT.strip():
+                margin = line[:len(line) - len(stripped)]
+                example = JavaScriptExample(stripped[len(PROMPT):], lineno)
+                examples.append(example)
+            elif example is None:
+                continue
+            elif not stripped:
+                # a blank line ends the session
+                example = None
+            elif (stripped.startswith(CONTINUED) or
+                  stripped == CONTINUED.strip()) and not example.want:
+                example.source += "\n" + stripped[len(CONTINUED):]
+            elif line.startswith(margin):
+                example.want.append(line[len(margin):].rstrip())
+            else:
+                example.want.append(stripped.rstrip())
+        return examples
 
     @classmethod
-    def from_match(cls, match):
-        interaction_re = re.compile(r"""
-            \n\s*?\n
-            (?P<codeblock> \s*?
-                (?P<prompt> \>\>\>)
-            )
-        """, re.VERBOSE | re.MULTILINE)
-        codeblock_re = re.compile(r"""
-            ::\s*?\n\s*?\n
-        """, re.VERBOSE | re.MULTILINE)
+    def rewrite(cls, indent, body):
+        body = text_outdent(indent, body)
+        body = cls._INTERACTION_RE.sub("\n\n.. sourcecode:: jscon" \
+                                       r"\n\n\g<codeblock>", body)
+        return cls._CODEBLOCK_RE.sub(":\n\n.. sourcecode:: js\n\n", body)
+
+    @classmethod
+    def from_match(cls, match, offset=None, span=None, document=None):
+        """Makes a docstring of a match. Its body is rewritten at once unless
+        the ``document`` and the ``span`` of the body in its source are given.
+        """
+        if offset is None:
+            offset = match.start()
         try:
             indent = match.group("indent")
             name = match.group("name")
@@ -196,11 +519,384 @@ class JavaScriptDocstring(object):
         except IndexError:
             name = sig = directive = None
             indent = ""
-        body = text_outdent(indent, match.group("body"))
-        body = interaction_re.sub("\n\n.. sourcecode:: jscon" \
-                                  "\n\n\g<codeblock>", body)
-        body = codeblock_re.sub(":\n\n.. sourcecode:: js\n\n", body)
-        return cls(indent, body, name, sig, directive)
+        else:
+            # shares the strings which many docstrings have
+            indent = intern(indent)
+            if directive is not None:
+                directive = intern(directive)
+            if name == sig:
+                name = sig
+        if document is None or span is None:
+            body = cls.rewrite(indent, match.group("body"))
+            return cls(indent, body, name, sig, directive, offset)
+        return cls(indent, None, name, sig, directive, offset, span, document)
+
+
+class JavaScriptExample(object):
+    """An example of an interactive session in a docstring: the source after
+    a ``>>>`` prompt and its ``...`` continuations, the lines of the expected
+    output and the line of the prompt in the body. ``//doctest: +SKIP`` in
+    the source skips it.
+    """
+
+    _OPTION_RE = re.compile(r"//\s*doctest:\s*(?P<options>.*)$", re.MULTILINE)
+
+    def __init__(self, source, lineno):
+        self.source = source
+        self.lineno = lineno
+        self.want = []
+
+    @property
+    def options(self):
+        options = set()
+        for match in self._OPTION_RE.finditer(self.source):
+            options.update(match.group("options").split())
+        return options
+
+    @property
+    def skip(self):
+        return "+SKIP" in self.options
+
+    def check(self, got):
+        """Whether the output of the example is the expected one, ignoring
+        trailing whitespace.
+        """
+        lines = [line.rstrip() for line in got.rstrip().split("\n")]
+        return lines == self.want or (not self.want and lines == [""])
+
+
+class JavaScriptParseCache(object):
+    """An on-disk cache of parsed docstrings. Each JavaScript file has an
+    entry which is keyed by its path and validated by its mtime and size, or
+    by the hash of its content when only the stat has changed. The entry
+    also has the hashes of the regions of the file, for
+    :meth:`JavaScriptDocument.rescan`. The least recently used entries are
+    evicted when the cache outgrows ``max_size`` bytes.
+    """
+
+    #: Bump it when the pickled docstrings become incompatible.
+    VERSION = 5
+
+    def __init__(self, dirname, max_size=None):
+        self.dirname = dirname
+        self.max_size = max_size
+
+    @classmethod
+    def from_env(cls, env):
+        if not env.config.autojs_cache:
+            return None
+        dirname = os.path.join(env.doctreedir, "autojs")
+        return cls(dirname, env.config.autojs_cache_size)
+
+    def entry_path(self, path):
+        key = os.path.abspath(path).encode("utf-8")
+        return os.path.join(self.dirname, hashlib.sha1(key).hexdigest())
+
+    def load(self, path):
+        try:
+            with open(self.entry_path(path), "rb") as f:
+                entry = pickle.load(f)
+        except Exception:
+            return None
+        if entry.get("version") != self.VERSION:
+            return None
+        return entry
+
+    def store(self, path, entry):
+        entry["version"] = self.VERSION
+        entry_path = self.entry_path(path)
+        temp_path = "%s.%d.tmp" % (entry_path, os.getpid())
+        try:
+            if not os.path.isdir(self.dirname):
+                os.makedirs(self.dirname)
+            with open(temp_path, "wb") as f:
+                pickle.dump(entry, f, pickle.HIGHEST_PROTOCOL)
+            if os.path.exists(entry_path):
+                os.remove(entry_path)
+            os.rename(temp_path, entry_path)
+        except (IOError, OSError):
+            pass
+
+    def touch(self, path):
+        try:
+            os.utime(self.entry_path(path), None)
+        except OSError:
+            pass
+
+    def evict(self):
+        """Removes the least recently used entries until the cache fits in
+        ``max_size`` bytes.
+        """
+        if not self.max_size or not os.path.isdir(self.dirname):
+            return
+        entries = []
+        total = 0
+        for filename in os.listdir(self.dirname):
+            entry_path = os.path.join(self.dirname, filename)
+            try:
+                stat = os.stat(entry_path)
+            except OSError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, entry_path))
+            total += stat.st_size
+        entries.sort()
+        for mtime, size, entry_path in entries:
+            if total <= self.max_size:
+                break
+            try:
+                os.remove(entry_path)
+            except OSError:
+                continue
+            total -= size
+
+
+class JavaScriptHighlightCache(JavaScriptParseCache):
+    """An on-disk cache of the code blocks of docstrings as highlighted by
+    Pygments. The entries are keyed by the hash of the code and of the
+    highlighting settings, so a block is highlighted again only when one of
+    them changes.
+    """
+
+    VERSION = 1
+
+    @classmethod
+    def from_env(cls, env):
+        if not env.config.autojs_highlight_cache:
+            return None
+        dirname = os.path.join(env.doctreedir, "autojs-highlight")
+        return cls(dirname, env.config.autojs_highlight_cache_size)
+
+    def entry_path(self, key):
+        return os.path.join(self.dirname, key)
+
+
+class JavaScriptHighlighter(object):
+    """Wraps the ``PygmentsBridge`` of a builder or a translator to take the
+    code blocks in ``sources`` from a :class:`JavaScriptHighlightCache`.
+    """
+
+    def __init__(self, highlighter, cache, sources):
+        self.highlighter = highlighter
+        self.cache = cache
+        self.sources = sources
+
+    def __getattr__(self, name):
+        return getattr(self.highlighter, name)
+
+    def make_key(self, source, lang, kwargs):
+        # the location is only for warnings
+        kwargs = sorted((key, value) for key, value in kwargs.items()
+                        if key != "location")
+        settings = sorted(getattr(self.highlighter, "formatter_args",
+                                  {}).items())
+        return hash_text(repr((pygments.__version__,
+                               getattr(self.highlighter, "dest", None),
+                               getattr(self.highlighter, "trim_doctest_flags",
+                                       None),
+                               settings, lang, kwargs, source)))
+
+    def highlight_block(self, source, lang, **kwargs):
+        if source not in self.sources:
+            return self.highlighter.highlight_block(source, lang, **kwargs)
+        key = self.make_key(source, lang, kwargs)
+        entry = self.cache.load(key)
+        if entry is not None:
+            self.cache.touch(key)
+            return entry["highlighted"]
+        highlighted = self.highlighter.highlight_block(source, lang, **kwargs)
+        self.cache.store(key, {"highlighted": highlighted})
+        return highlighted
+
+
+class JavaScriptMemberIndex(object):
+    """Maps the name of a docstring to its members. The members keep the
+    order of the given docstrings. A docstring that has been included in
+    another one is not found again.
+    """
+
+    def __init__(self, docstrings):
+        self.members = {}
+        self.included = set()
+        for doc in docstrings:
+            for name in doc.get_parent_names():
+                self.members.setdefault(name, []).append(doc)
+
+    def find_members(self, parent, is_member=None):
+        for mem in self.members.get(parent.name, []):
+            if mem in self.included:
+                continue
+            elif callable(is_member) and not is_member(mem):
+                continue
+            yield mem
+
+
+class JavaScriptScanner(object):
+    """Finds the ``/** ... */`` comment blocks of a JavaScript source in a
+    single pass. It skips string, template and regular expression literals
+    and line comments, so a ``/**`` inside them doesn't start a docstring.
+
+    The source may be a string or a bytes-like object such as a memory-mapped
+    file.
+    """
+
+    _PATTERNS = {
+        "token": r"""
+            (?P<line_comment> //)
+          | (?P<docstring> /\*\*(?!/))
+          | (?P<comment> /\*)
+          | (?P<slash> /)
+          | (?P<single> ')
+          | (?P<double> ")
+          | (?P<template> `)
+          | (?P<open> \{)
+          | (?P<close> \})
+        """,
+        "single": r"'(?:[^'\\\n]|\\.)*'",
+        "double": r'"(?:[^"\\\n]|\\.)*"',
+        "template": r"(?:[^`\\$]|\\.|\$(?!\{))*(`|\$\{)?",
+        "regex": r"/(?:[^/\\\[\n]|\\.|\[(?:[^\]\\\n]|\\.)*\])+/",
+        "word": r"[\w$]+$",
+    }
+    _TEXT_RES = dict((name, re.compile(pattern, re.VERBOSE | re.DOTALL))
+                     for name, pattern in _PATTERNS.items())
+    _BYTES_RES = dict((name, re.compile(pattern.encode("ascii"),
+                                        re.VERBOSE | re.DOTALL))
+                      for name, pattern in _PATTERNS.items())
+    #: A regular expression literal can follow these characters and keywords
+    #: but a division operator can't.
+    REGEX_PRECEDERS = set("(,=:[!&|?{};~+-*%<>^")
+    REGEX_KEYWORDS = set(["return", "typeof", "instanceof", "in", "of", "new",
+                          "delete", "void", "throw", "case", "do", "else",
+                          "yield", "await"])
+
+    def __init__(self, source):
+        self.source = source
+        if isinstance(source, str):
+            self._res = self._TEXT_RES
+            self._newline, self._comment_end = "\n", "*/"
+        else:
+            self._res = self._BYTES_RES
+            self._newline, self._comment_end = b"\n", b"*/"
+
+    def scan(self, start=0, end=None):
+        """Yields the ``(start, end)`` spans of the comment blocks which start
+        with ``/**`` from ``start`` to ``end``. ``start`` should be at the
+        start of a statement. The position where the scan stopped is left in
+        :attr:`pos`, which is beyond ``end`` if a literal or a comment
+        crossed it, and :attr:`nested` tells whether a comment block was
+        found in the ``${...}`` of a template literal.
+        """
+        source = self.source
+        res = self._res
+        template_depths = []
+        if end is None:
+            end = len(source)
+        pos = self.pos = start
+        self.nested = False
+        while True:
+            # an unterminated literal or comment runs to the end
+            self.pos = len(source) if pos < 0 or template_depths else pos
+            if pos < 0:
+                return
+            match = res["token"].search(source, pos, end)
+            if not match:
+                return
+            start = match.start()
+            token = match.lastgroup
+            if token == "line_comment":
+                pos = source.find(self._newline, start)
+            elif token in ("docstring", "comment"):
+                pos = source.find(self._comment_end, start + 2)
+                if pos < 0:
+                    continue
+                pos += 2
+                if token == "docstring":
+                    if template_depths:
+                        self.nested = True
+                    yield start, pos
+            elif token == "slash":
+                match = self.is_regex_allowed(start) and \
+                        res["regex"].match(source, start)
+                pos = match.end() if match else start + 1
+            elif token in ("single", "double"):
+                match = res[token].match(source, start)
+                if match:
+                    pos = match.end()
+                else:
+                    pos = source.find(self._newline, start)
+            elif token == "template":
+                pos = self._skip_template(start + 1, template_depths)
+            elif not template_depths:
+                pos = start + 1
+            elif token == "open":
+                template_depths[-1] += 1
+                pos = start + 1
+            elif template_depths[-1]:
+                template_depths[-1] -= 1
+                pos = start + 1
+            else:
+                # the end of ``${...}`` in a template literal
+                template_depths.pop()
+                pos = self._skip_template(start + 1, template_depths)
+
+    def _skip_template(self, pos, template_depths):
+        match = self._res["template"].match(self.source, pos)
+        if not match.group(1):
+            return len(self.source)
+        elif len(match.group(1)) == 2:
+            # ``${``
+            template_depths.append(0)
+        return match.end()
+
+    def char_at(self, pos):
+        char = self.source[pos:pos + 1]
+        if not isinstance(char, str):
+            char = char.decode("latin-1")
+        return char
+
+    def is_regex_allowed(self, pos):
+        """Whether a slash at the position starts a regular expression literal
+        rather than a division operator.
+        """
+        pos -= 1
+        while pos >= 0 and self.char_at(pos).isspace():
+            pos -= 1
+        if pos < 0 or self.char_at(pos) in self.REGEX_PRECEDERS:
+            return True
+        match = self._res["word"].search(self.source, max(0, pos - 16),
+                                         pos + 1)
+        if not match:
+            return False
+        word = match.group(0)
+        if not isinstance(word, str):
+            word = word.decode("latin-1")
+        return word in self.REGEX_KEYWORDS
+
+
+class JavaScriptPrefixTrie(object):
+    """Tells whether a name starts with one of the prefixes in time
+    proportional to the length of the name.
+    """
+
+    def __init__(self, prefixes):
+        self.root = {}
+        for prefix in prefixes:
+            node = self.root
+            for char in prefix:
+                node = node.setdefault(char, {})
+            node[None] = True
+
+    def match(self, name):
+        node = self.root
+        if None in node:
+            return True
+        for char in name:
+            node = node.get(char)
+            if node is None:
+                return False
+            elif None in node:
+                return True
+        return False
 
 
 class JavaScriptDocument(object):
@@ -232,88 +928,1144 @@ class JavaScriptDocument(object):
         (?P<docsuffix> \*/)
     """, re.VERBOSE | re.MULTILINE | re.DOTALL)
 
-    def __init__(self, path):
-        with open(path) as f:
-            self.source = "".join(f.readlines())
+    #: The order of the object types for ``:member-order: groupwise``.
+    GROUPWISE_ORDER = ["class", "member", "attribute", "method", "staticmethod",
+                       "data", "function"]
+
+    #: The start of a line which starts a docstring, where a shard can start.
+    _SHARD_START_RE = re.compile(br"\n[ ]*/\*\*(?!/)")
+
+    #: The encoding of memory-mapped sources.
+    MMAP_ENCODING = "utf-8"
+
+    #: The suffix of the file of precompiled docstrings next to a source.
+    PRECOMPILED_SUFFIX = ".autojs.jsonl"
+    #: Bump it when the precompiled docstrings become incompatible.
+    PRECOMPILED_VERSION = 1
+
+    #: The least size of the regions of a source, in characters or in bytes
+    #: if it is memory-mapped, which are hashed to scan only the changed ones
+    #: again.
+    REGION_SIZE = 16 * 1024
+
+    #: The size of the blocks of a source whose lines are counted once, so
+    #: that the line of a position is counted from the start of its block.
+    LINE_BLOCK_SIZE = 4096
+
+    def __init__(self, path, cache=None, mmap_threshold=None, profile=None,
+                 shard_size=None, shard_workers=1, precompiled=False):
+        self.path = path
+        self.cache = cache
+        self.mmap_threshold = mmap_threshold
+        self.profile = profile
+        self.shard_size = shard_size
+        self.shard_workers = shard_workers
+        self.precompiled = precompiled
+        self._nested = None
+        self._source = None
+        self._lines = None
+        self._digest = None
+        self._parsed = None
+
+    @property
+    def source(self):
+        """The source as a string, or as a read-only :class:`mmap.mmap` of the
+        file if it is not smaller than ``mmap_threshold`` bytes. Only the
+        docstrings are decoded from a memory-mapped source.
+        """
+        if self._source is None:
+            with self.timing("read"):
+                self._source = self._read()
+        return self._source
+
+    def is_mapped(self, size):
+        """Whether a source of ``size`` bytes is memory-mapped. The spans of
+        the docstrings are in bytes then, and in characters otherwise.
+        """
+        return self.mmap_threshold is not None and \
+               size >= max(self.mmap_threshold, 1)
+
+    def is_sharded(self, size):
+        """Whether a source of ``size`` bytes is scanned in shards. Only a
+        memory-mapped source is, so that the processes which scan the shards
+        share its pages.
+        """
+        return bool(self.shard_size) and self.is_mapped(size) and \
+               size > self.shard_size
+
+    def _read(self):
+        if self.is_mapped(os.path.getsize(self.path)):
+            with open(self.path, "rb") as f:
+                return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        with open(self.path) as f:
+            return f.read()
+
+    def timing(self, phase):
+        """Returns a context manager that records the time spent in it as
+        ``phase`` of this file, if the document has a profile.
+        """
+        if self.profile is None:
+            return no_timing()
+        return self.profile.timing(self.path, phase)
+
+    def _decode(self, start, end):
+        text = self.source[start:end]
+        if not isinstance(text, str):
+            text = text.decode(self.MMAP_ENCODING)
+        return text
+
+    def parse(self):
+        """Returns a pair of the module description (or ``None``) and the list
+        of the named docstrings. The result comes from the parse cache when the
+        file has not been changed.
+        """
+        if self._parsed is None:
+            self._parsed = self._load()
+        return self._parsed
+
+    def _load(self):
+        parsed = self.load()
+        if parsed is None:
+            parsed = self._parse()
+            if self.cache is not None:
+                self._store(parsed)
+        return parsed
+
+    def load(self):
+        """Returns the parsed docstrings from the parse cache or from the
+        precompiled file, or ``None`` if neither has them.
+        """
+        parsed = None
+        if self.cache is not None:
+            parsed = self.load_cached()
+        if parsed is None and self.precompiled:
+            parsed = self.load_precompiled()
+            if parsed is not None and self.cache is not None:
+                self._store(parsed)
+        return parsed
+
+    def load_cached(self):
+        """Returns the parsed docstrings from the parse cache or ``None`` if
+        the file has been changed. A changed file is scanned again only where
+        it differs from the cached one, if it can be.
+        """
+        stat = os.stat(self.path)
+        entry = self.cache.load(self.path)
+        if entry is None or entry["mapped"] != self.is_mapped(stat.st_size):
+            return None
+        parsed = self.attach((entry["description"], entry["docstrings"]))
+        if (entry["mtime"], entry["size"]) == (stat.st_mtime, stat.st_size):
+            self.cache.touch(self.path)
+            if self._digest is None:
+                self._digest = entry["hash"]
+            return parsed
+        elif entry["hash"] == self.digest:
+            self._store(parsed, entry["regions"])
+            return parsed
+        elif entry["regions"] is None:
+            return None
+        with self.timing("scan"):
+            rescanned = self.rescan(parsed, entry["length"], entry["regions"])
+        if rescanned is not None:
+            parsed, regions = rescanned
+            self._store(parsed, regions)
+            return parsed
+
+    def get_bounds(self, docstrings, length):
+        """Returns the bounds of the regions of a source of ``length``. A
+        region ends where the first named docstring after at least
+        :attr:`REGION_SIZE` of it starts.
+        """
+        bounds = [0]
+        for doc in docstrings:
+            if doc.offset >= bounds[-1] + self.REGION_SIZE:
+                bounds.append(doc.offset)
+        bounds.append(length)
+        return bounds
+
+    def get_regions(self, docstrings, known={}):
+        """Returns the hashes of the regions of the source. ``known`` maps
+        the spans of some regions to their hashes.
+        """
+        source = self.source
+        bounds = self.get_bounds(docstrings, len(source))
+        regions = []
+        for span in zip(bounds[:-1], bounds[1:]):
+            digest = known.get(span)
+            if digest is None:
+                digest = hash_text(source[span[0]:span[1]])
+            regions.append(digest)
+        return regions
+
+    def rescan(self, parsed, length, regions):
+        """Scans the source again between the regions which are unchanged at
+        its start and, shifted by the change of its length, at its end, and
+        keeps the docstrings of these regions. ``parsed``, ``length`` and
+        ``regions`` are those of the cached source, which had no docstring
+        in a template literal, as each region must start outside of any
+        literal. Returns the parsed docstrings and the hashes of their
+        regions, or ``None`` if a literal or a comment crossed the end of the
+        scanned part.
+        """
+        docstrings = parsed[1]
+        source = self.source
+        delta = len(source) - length
+        bounds = self.get_bounds(docstrings, length)
+        count = len(regions)
+        def is_unchanged(i, shift):
+            start, end = bounds[i] + shift, bounds[i + 1] + shift
+            return end <= len(source) and \
+                   hash_text(source[start:end]) == regions[i]
+        # the scan starts where a docstring or the source starts
+        head = 0
+        while head < count - 1 and is_unchanged(head, 0):
+            head += 1
+        def is_moved(i):
+            # spaces before a docstring would be its indent
+            start = bounds[i] + delta
+            return start >= bounds[head] and \
+                   source[start - 1:start] not in (" ", b" ") and \
+                   is_unchanged(i, delta)
+        tail = count
+        while tail > head + 1 and is_moved(tail - 1):
+            tail -= 1
+        start, end = bounds[head], bounds[tail] + delta
+        scanner = JavaScriptScanner(source)
+        changed = list(self.get_docstrings(scanner, start, end))
+        if scanner.pos > end:
+            return None
+        self._nested = scanner.nested
+        known = {}
+        for i in range(head):
+            known[bounds[i], bounds[i + 1]] = regions[i]
+        offsets = [doc.offset for doc in docstrings]
+        kept = docstrings[:bisect.bisect_left(offsets, start)]
+        moved = docstrings[bisect.bisect_left(offsets, bounds[tail]):]
+        for doc in moved:
+            doc.offset += delta
+            if doc.start is not None:
+                doc.start += delta
+                doc.end += delta
+        for i in range(tail, count):
+            known[bounds[i] + delta, bounds[i + 1] + delta] = regions[i]
+        docstrings = kept + changed + moved
+        try:
+            description = self.get_description()
+        except ValueError:
+            description = None
+        if self.profile is not None:
+            self.profile.count(self.path, docstrings=len(changed),
+                               bytes=end - start)
+        if self._nested:
+            return (description, docstrings), None
+        return (description, docstrings), self.get_regions(docstrings, known)
+
+    @property
+    def precompiled_path(self):
+        return self.path + self.PRECOMPILED_SUFFIX
+
+    def save_precompiled(self):
+        """Writes the parsed docstrings to the precompiled file as JSON lines.
+        The first line has the hash of the source and the description, and
+        each of the others has a named docstring.
+        """
+        description, docstrings = self.parse()
+        def to_json(doc):
+            record = {"offset": doc.offset, "span": doc.span,
+                      "indent": doc.indent}
+            if doc.sig is not None:
+                record["sig"] = doc.sig
+            if doc.name != doc.sig:
+                record["name"] = doc.name
+            if doc.directive is not None:
+                record["directive"] = doc.directive
+            return record
+        header = {"autojs": self.PRECOMPILED_VERSION, "hash": self.digest,
+                  "length": len(self.source),
+                  "mapped": not isinstance(self.source, str),
+                  "nested": self._nested is not False,
+                  "count": len(docstrings),
+                  "description": description and to_json(description)}
+        path = self.precompiled_path
+        temp_path = "%s.%d.tmp" % (path, os.getpid())
+        with open(temp_path, "w") as f:
+            f.write(json.dumps(header, sort_keys=True) + "\n")
+            for doc in docstrings:
+                f.write(json.dumps(to_json(doc), sort_keys=True) + "\n")
+        if os.path.exists(path):
+            os.remove(path)
+        os.rename(temp_path, path)
+        return len(docstrings)
+
+    def load_precompiled(self):
+        """Returns the parsed docstrings from the precompiled file or ``None``
+        if there is none for the current source.
+        """
+        try:
+            f = open(self.precompiled_path)
+        except (IOError, OSError):
+            return None
+        with f:
+            try:
+                header = json.loads(f.readline())
+            except ValueError:
+                return None
+            if header.get("autojs") != self.PRECOMPILED_VERSION or \
+               header["mapped"] != self.is_mapped(os.path.getsize(self.path)) \
+               or header["hash"] != self.digest:
+                return None
+            def from_json(record):
+                sig = record.get("sig")
+                return JavaScriptDocstring(
+                    intern(record["indent"]), None, record.get("name", sig),
+                    sig, record.get("directive"), record["offset"],
+                    record["span"], self)
+            description = header["description"]
+            if description is not None:
+                description = from_json(description)
+            docstrings = [from_json(json.loads(line)) for line in f]
+        if len(docstrings) != header["count"]:
+            return None
+        self._nested = header["nested"]
+        return description, docstrings
+
+    def attach(self, parsed):
+        """Attaches the docstrings parsed from this file in another process
+        or in an earlier build to this document, and returns them.
+        """
+        description, docstrings = parsed
+        if description is not None:
+            description.document = self
+        for doc in docstrings:
+            doc.document = self
+        return parsed
+
+    def _store(self, parsed, regions=None):
+        stat = os.stat(self.path)
+        description, docstrings = parsed
+        if regions is None and self._nested is False:
+            # the regions of a file whose docstrings may be in template
+            # literals are not kept
+            regions = self.get_regions(docstrings)
+        self.cache.store(self.path, {"hash": self.digest,
+                                     "mtime": stat.st_mtime,
+                                     "size": stat.st_size,
+                                     "mapped": self.is_mapped(stat.st_size),
+                                     "length": len(self.source),
+                                     "regions": regions,
+                                     "description": description,
+                                     "docstrings": docstrings})
+
+    @property
+    def digest(self):
+        if self._digest is None:
+            self._digest = hash_text(self.source)
+        return self._digest
+
+    def _parse(self):
+        with self.timing("scan"):
+            try:
+                description = self.get_description()
+            except ValueError:
+                description = None
+            if self.is_sharded(len(self.source)):
+                docstrings = self.get_sharded_docstrings()
+            else:
+                scanner = JavaScriptScanner(self.source)
+                docstrings = list(self.get_docstrings(scanner))
+                self._nested = scanner.nested
+        if self.profile is not None:
+            self.profile.count(self.path, docstrings=len(docstrings),
+                               bytes=len(self.source))
+        return description, docstrings
 
     def get_description(self):
-        match = self._MODULE_DOCSTRING_RE.match(self.source)
+        source = self.source
+        if not isinstance(source, str):
+            # decodes the first comment block only
+            end = source.find(b"*/") if source[:3] == b"/**" else -1
+            source = self._decode(0, end + 2 if end >= 0 else 0)
+        match = self._MODULE_DOCSTRING_RE.match(source)
         if not match:
             raise ValueError("There is no docstring for the module.")
-        return JavaScriptDocstring.from_match(match)
+        return JavaScriptDocstring.from_match(match, span=self._span(match),
+                                              document=self)
 
-    def get_docstrings(self):
-        matches = self._DOCSTRING_RE.finditer(self.source)
-        if not matches:
-            raise ValueError("There is no any named docstring.")
-        for match in matches:
-            yield JavaScriptDocstring.from_match(match)
+    def get_lineno(self, pos):
+        """Returns the line number of a position in the source."""
+        source = self.source
+        newline = "\n" if isinstance(source, str) else b"\n"
+        size = self.LINE_BLOCK_SIZE
+        if self._lines is None:
+            # the line numbers at the start of each block
+            self._lines = lines = [1]
+            for start in range(0, len(source) - size, size):
+                lines.append(lines[-1] +
+                             source[start:start + size].count(newline))
+        block = min(pos // size, len(self._lines) - 1)
+        return self._lines[block] + \
+               source[block * size:pos].count(newline)
 
-    def auto_include_desc(self, rst, options):
-        if not options.get("exclude-desc"):
-            try:
-                rst.append(self.get_description().to_rst())
-            except ValueError:
-                pass
+    def _span(self, match, base=0):
+        """Returns the span of the body of a match in the source. The text of
+        the match is decoded from ``base`` if the source is memory-mapped.
+        """
+        start, end = match.span("body")
+        if isinstance(self.source, str):
+            return start, end
+        # in bytes
+        start = base + len(match.string[:start].encode(self.MMAP_ENCODING))
+        body = match.group("body").encode(self.MMAP_ENCODING)
+        return start, start + len(body)
 
-    def auto_include_members(self, rst, options):
-        members = options.get("members")
-        compare = self._make_comparer(options.get("member-order"))
-        docstrings = list(self.get_docstrings())
+    def get_docstrings(self, scanner=None, start=0, end=None):
+        """Yields the named docstrings which ``scanner``, a new
+        :class:`JavaScriptScanner` by default, finds from ``start`` to
+        ``end``.
+        """
+        source = self.source
+        if scanner is None:
+            scanner = JavaScriptScanner(source)
+        for start, end in scanner.scan(start, end):
+            indent_start = start
+            while indent_start and \
+                  source[indent_start - 1:indent_start] in (" ", b" "):
+                indent_start -= 1
+            if isinstance(source, str):
+                match = self._DOCSTRING_RE.match(source, indent_start, end)
+            else:
+                match = self._DOCSTRING_RE.match(
+                    self._decode(indent_start, end))
+            if match:
+                yield JavaScriptDocstring.from_match(
+                    match, indent_start, self._span(match, indent_start),
+                    self)
+
+    def get_shards(self):
+        """Returns the ``(start, end)`` spans of the shards of the source. A
+        shard ends after at least ``shard_size`` bytes, before the next line
+        which starts a docstring.
+        """
+        size = len(self.source)
+        bounds = [0]
+        while bounds[-1] + self.shard_size < size:
+            match = self._SHARD_START_RE.search(self.source,
+                                                bounds[-1] + self.shard_size)
+            if not match:
+                break
+            bounds.append(match.start() + 1)
+        bounds.append(size)
+        return list(zip(bounds[:-1], bounds[1:]))
 
-        cmp_to_key = getattr(functools, 'cmp_to_key', None)
-        if cmp_to_key:
-            docstrings.sort(key=functools.cmp_to_key(compare))
+    def scan_shard(self, start, end):
+        """Returns the named docstrings of a shard, the position where the
+        scan stopped and whether a docstring was in a template literal.
+        """
+        scanner = JavaScriptScanner(self.source)
+        docstrings = list(self.get_docstrings(scanner, start, end))
+        return docstrings, scanner.pos, scanner.nested
+
+    def get_sharded_docstrings(self):
+        """Returns the named docstrings of the shards, which are scanned in a
+        pool of ``shard_workers`` processes if there are more than one, in
+        source order. The whole source is scanned again if a literal or a
+        comment crossed the end of a shard, as the line after it did not
+        really start a docstring.
+        """
+        shards = self.get_shards()
+        futures = get_futures(self.shard_workers, len(shards))
+        if futures is None:
+            results = (self.scan_shard(start, end) for start, end in shards)
         else:
-            docstrings.sort(cmp=compare)
+            with futures.ProcessPoolExecutor(self.shard_workers) as executor:
+                results = list(executor.map(
+                    scan_shard, [self.path] * len(shards),
+                    [self.mmap_threshold] * len(shards),
+                    *zip(*shards)))
+        docstrings = []
+        self._nested = False
+        for (start, end), (shard, pos, nested) in zip(shards, results):
+            if pos > end:
+                scanner = JavaScriptScanner(self.source)
+                docstrings = list(self.get_docstrings(scanner))
+                self._nested = scanner.nested
+                return docstrings
+            docstrings.extend(self.attach((None, shard))[1])
+            self._nested = self._nested or nested
+        return docstrings
 
-        if members is not None:
-            exclude_members = options.get("exclude-members", [])
-            is_member = self._make_member_checker(members, exclude_members)
-            for doc in docstrings:
-                if is_member(doc):
-                    rst.append(doc.to_rst(docstrings, is_member=is_member))
+    def auto_include_desc(self, options, linenos=True):
+        if not options.get("exclude-desc"):
+            description = self.parse()[0]
+            if description is not None:
+                for chunk in description.iter_rst(linenos=linenos):
+                    yield chunk
+
+    def auto_include_members(self, options, linenos=True):
+        docstrings, index, is_member = self.select_members(options)
+        return JavaScriptDocstring.iter_many_rst(
+            docstrings, index, is_member=is_member, rendered=self.rendered,
+            linenos=linenos)
+
+    def iter_members(self, options):
+        """Yields ``(docstring, index, is_member)`` for the top-level
+        docstrings to document.  Each one should be documented before the
+        next is requested as nested members are skipped afterwards.
+        """
+        docstrings, index, is_member = self.select_members(options)
+        for doc in docstrings:
+            yield doc, index, is_member
+
+    def select_members(self, options):
+        """Returns an iterator over the top-level docstrings to document, the
+        :class:`JavaScriptMemberIndex` of their members and the checker of
+        ``:members:`` as :meth:`iter_members` yields them.
+        """
+        key = self._make_sort_key(options.get("member-order"))
+        docstrings = list(self.parse()[1])
+        if key is not None:
+            with self.timing("sort"):
+                docstrings.sort(key=key)
+
+        index = JavaScriptMemberIndex(docstrings)
+        is_member = self._get_member_checker(options)
+        selected = (doc for doc in docstrings
+                    if doc not in index.included and
+                    (is_member is None or is_member(doc)))
+        return selected, index, is_member
+
+    def _get_member_checker(self, options):
+        """Returns the member checker of the options, or ``None`` if they
+        select every docstring.
+        """
+        members = options.get("members")
+        symbol = options.get("symbol")
+        if members is None and symbol is None:
+            return None
+        exclude_members = options.get("exclude-members", [])
+        return self._make_member_checker(members, exclude_members, symbol)
+
+    def _make_member_checker(self, members, exclude_members, symbol=None):
+        """Returns a function that tells whether the name of a docstring
+        starts with one of ``members`` but none of ``exclude_members``. With
+        a ``symbol``, the name also has to be the symbol or the name of one
+        of its members.
+        """
+        def make_matcher(prefixes):
+            if prefixes is ALL or prefixes is None:
+                return lambda name: True
+            return JavaScriptPrefixTrie(prefixes).match
+        includes = make_matcher(members)
+        if symbol is not None:
+            members_match = includes
+            prefix = symbol + "."
+            includes = lambda name: (name == symbol or
+                                     name.startswith(prefix)) and \
+                                    members_match(name)
+        if exclude_members is members:
+            excludes = lambda name: False
         else:
-            for doc in docstrings:
-                rst.append(doc.to_rst(docstrings))
-
-    def _make_member_checker(self, members, exclude_members):
-        __members__ = members
-        def is_member(doc, members=None):
-            if members is None:
-                members = __members__
-            if members is not exclude_members and \
-               is_member(doc, exclude_members):
-                return False
-            elif members is ALL or doc.name in members:
-                return True
-            for mem in members:
-                if doc.name.startswith(mem):
-                    return True
-            return False
+            excludes = make_matcher(exclude_members)
+        def is_member(doc):
+            return includes(doc.name) and not excludes(doc.name)
         return is_member
 
-    def _make_comparer(self, member_order):
+    def _make_sort_key(self, member_order):
+        """Returns the key function for the member order or ``None`` for
+        ``bysource``, since the docstrings are already in the source order.
+        """
         if not member_order or member_order == "alphabetical":
-            return lambda d1, d2: (d1.name > d2.name) - (d1.name < d2.name)
+            return lambda doc: doc.name
         elif member_order == "groupwise":
-            order = ["class", "member", "attribute", "method", "staticmethod",
-                     "data", "function"]
-            def compare(d1, d2):
-                i1 = order.index(d1.guess_objtype())
-                i2 = order.index(d2.guess_objtype())
-                return (i1 > i2) - (i1 < i2) or \
-                       self._make_comparer(None)(d1, d2)
-            return compare
+            ranks = dict((objtype, i)
+                         for i, objtype in enumerate(self.GROUPWISE_ORDER))
+            return lambda doc: (ranks[doc.guess_objtype()], doc.name)
         elif member_order == "bysource":
-            return lambda d1, d2: 1
+            return None
+        raise ValueError("Unknown member order: %r" % member_order)
+
+    def make_record(self, options):
+        """Makes a record of the last :meth:`to_rst` call to decide later
+        whether the output would be changed by an edit of the file.
+        """
+        names = set(doc.name for doc in self.rendered)
+        return {"path": os.path.abspath(self.path),
+                "mtime": os.path.getmtime(self.path),
+                "options": options_key(options),
+                "names": names,
+                "digest": self._digest_rendered(names, options)}
+
+    def is_outdated(self, record):
+        """Whether the output of the recorded :meth:`to_rst` call would be
+        changed. It is when one of the rendered docstrings was changed or
+        removed, or when a new docstring would be selected.
+        """
+        options = options_from_key(record["options"])
+        names = record["names"]
+        if self._digest_rendered(names, options) != record["digest"]:
+            return True
+        is_member = self._get_member_checker(options) or (lambda doc: True)
+        parents = tuple(name + "." for name in names)
+        for doc in self.parse()[1]:
+            if doc.name not in names and \
+               (is_member(doc) or doc.name.startswith(parents)):
+                return True
+        return False
+
+    def _digest_rendered(self, names, options):
+        description, docstrings = self.parse()
+        docs = [doc for doc in docstrings if doc.name in names]
+        if not options.get("exclude-desc"):
+            docs.insert(0, description)
+        texts = []
+        for doc in docs:
+            if doc is None:
+                texts.append("")
+            else:
+                # the body is rewritten from its indent and raw text
+                texts.extend([doc.name or "", doc.sig or "",
+                              doc.directive or "", doc.indent, doc.raw_body])
+        return hash_text("\0".join(texts))
 
     def to_rst(self, options={}):
         rst = []
-        self.auto_include_desc(rst, options)
-        self.auto_include_members(rst, options)
+        for lines, linenos in self.iter_rst(options, False):
+            rst.extend(lines)
         return "\n".join(rst)
 
+    def iter_rst(self, options={}, linenos=True):
+        """Yields the lines of :meth:`to_rst` as ``(lines, linenos)``, a
+        docstring at a time, with the lines of the source where they come
+        from, counted from 0, unless ``linenos`` is false. A docstring is
+        rendered only when it is requested, so the output can be consumed
+        without keeping all of it.
+        """
+        self.rendered = []
+        chunks = itertools.chain(self.auto_include_desc(options, linenos),
+                                 self.auto_include_members(options, linenos))
+        if self.profile is None:
+            return chunks
+        return self._time_chunks(chunks)
+
+    def _time_chunks(self, chunks):
+        # only the rendering of a chunk is timed, not what the consumer does
+        # with it
+        while True:
+            with self.timing("nest"):
+                chunk = next(chunks, None)
+            if chunk is None:
+                return
+            yield chunk
+
+
+def find_files(root):
+    """Yields the ``.js`` files under the directory in a stable order."""
+    for dirpath, dirnames, filenames in os.walk(root):
+        dirnames.sort()
+        for filename in sorted(filenames):
+            if filename.endswith(".js"):
+                yield os.path.join(dirpath, filename)
+
+
+def find_sources(pattern):
+    """Returns the base directory and the JavaScript files of a directory, a
+    glob pattern (``**`` matches subdirectories) or a file path.
+    """
+    if os.path.isdir(pattern):
+        return pattern, list(find_files(pattern))
+    elif not glob.has_magic(pattern):
+        paths = [pattern] if os.path.isfile(pattern) else []
+        return os.path.dirname(pattern), paths
+    try:
+        paths = glob.glob(pattern, recursive=True)
+    except TypeError:
+        paths = glob.glob(pattern)
+    base = []
+    for part in pattern.replace(os.sep, "/").split("/"):
+        if glob.has_magic(part):
+            break
+        base.append(part)
+    return "/".join(base), sorted(path for path in set(paths)
+                                  if os.path.isfile(path))
+
+
+def get_futures(workers, count):
+    """Returns :mod:`concurrent.futures` to run ``count`` tasks in a pool of
+    ``workers``, or ``None`` if they should run one after another, when there
+    are fewer than two of either or the module is missing on Python 2.
+    """
+    if workers < 2 or count < 2:
+        return None
+    try:
+        from concurrent import futures
+    except ImportError:
+        return None
+    return futures
+
+
+def parse_file(path, cache=None, mmap_threshold=None, profile=None):
+    """Parses a JavaScript file in a worker process of
+    :meth:`JavaScriptIndex.preparse`. Returns the parsed docstrings and the
+    profile.
+    """
+    document = JavaScriptDocument(path, cache, mmap_threshold, profile)
+    return document.parse(), profile
+
+
+def precompile_file(path, mmap_threshold=None):
+    """Writes the precompiled file of a JavaScript file in a worker process
+    of :func:`main`. Returns the number of docstrings.
+    """
+    return JavaScriptDocument(path, mmap_threshold=mmap_threshold) \
+        .save_precompiled()
+
+
+def scan_shard(path, mmap_threshold, start, end):
+    """Scans a shard of a memory-mapped JavaScript file in a worker process
+    of :meth:`JavaScriptDocument.get_sharded_docstrings`.
+    """
+    document = JavaScriptDocument(path, mmap_threshold=mmap_threshold)
+    return document.scan_shard(start, end)
+
+
+@contextmanager
+def no_timing():
+    yield
+
+
+@contextmanager
+def source_lines(state, content, content_offset=0):
+    """Makes docutils report the messages about ``content``, parsed at
+    ``content_offset``, in the files and at the lines of its items. The lines
+    generated by autojs are reported as before.
+    """
+    reporter = state.memo.reporter
+    get_source_and_line = reporter.get_source_and_line
+
+    def get_content_source_and_line(lineno=None):
+        if lineno is not None:
+            try:
+                source, offset = content.info(lineno - content_offset - 1)
+            except IndexError:
+                source = offset = None
+            # past the end of the content, the offset is None
+            if offset is not None and source != "<autojs>":
+                return source, offset + 1
+        return get_source_and_line(lineno)
+
+    reporter.get_source_and_line = get_content_source_and_line
+    try:
+        yield
+    finally:
+        reporter.get_source_and_line = get_source_and_line
+
+
+class JavaScriptProfile(object):
+    """The time spent in each phase of processing the JavaScript files, and
+    the numbers of docstrings and bytes scanned, per file. The time of a
+    phase excludes the phases nested in it.
+    """
+
+    PHASES = ["read", "scan", "rewrite", "sort", "nest", "parse"]
+    COUNTS = ["docstrings", "bytes"]
+
+    #: The number of the slowest files in :meth:`format_table`.
+    TABLE_SIZE = 20
+
+    def __init__(self):
+        self.pid = os.getpid()
+        self.files = {}
+        self._stack = []
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state["_stack"] = []
+        return state
+
+    def get_file(self, path):
+        if self.pid != os.getpid():
+            # a forked reader reports only its own files
+            self.pid = os.getpid()
+            self.files = {}
+        if path not in self.files:
+            self.files[path] = dict.fromkeys(self.PHASES + self.COUNTS, 0)
+        return self.files[path]
+
+    def count(self, path, **counts):
+        stats = self.get_file(path)
+        for name, value in counts.items():
+            stats[name] += value
+
+    @contextmanager
+    def timing(self, path, phase):
+        now = timer()
+        if self._stack:
+            self._charge(self._stack[-1], now)
+        self._stack.append([path, phase, now])
+        try:
+            yield
+        finally:
+            now = timer()
+            self._charge(self._stack.pop(), now)
+            if self._stack:
+                self._stack[-1][2] = now
+
+    def _charge(self, frame, now):
+        path, phase, start = frame
+        self.get_file(path)[phase] += now - start
+        frame[2] = now
+
+    def merge(self, other):
+        """Adds the numbers of a profile made in another process."""
+        if other is None or other.pid == self.pid:
+            return
+        for path, other_stats in other.files.items():
+            self.count(path, **other_stats)
+
+    def get_total(self):
+        total = dict.fromkeys(self.PHASES + self.COUNTS, 0)
+        for stats in self.files.values():
+            for name in total:
+                total[name] += stats[name]
+        return total
+
+    def to_json(self):
+        return {"phases": self.PHASES, "total": self.get_total(),
+                "files": self.files}
+
+    def format_table(self, base=None):
+        """Returns the lines of a table of the slowest files and the total,
+        with the times in milliseconds.
+        """
+        def total_time(stats):
+            return sum(stats[phase] for phase in self.PHASES)
+        def format_row(name, stats):
+            times = ["%8.1f" % (stats[phase] * 1000)
+                     for phase in self.PHASES + ["total"]]
+            return "%-32s %s %10d %12d" % (name[-32:], " ".join(times),
+                                          stats["docstrings"], stats["bytes"])
+        header = "%-32s %s %10s %12s" % (
+            "file", " ".join("%8s" % phase
+                             for phase in self.PHASES + ["total"]),
+            "docstrings", "bytes")
+        lines = [header, "-" * len(header)]
+        files = sorted(self.files.items(),
+                       key=lambda item: -total_time(item[1]))
+        for path, stats in files[:self.TABLE_SIZE]:
+            if base is not None:
+                path = os.path.relpath(path, base)
+            stats = dict(stats, total=total_time(stats))
+            lines.append(format_row(path, stats))
+        total = self.get_total()
+        total["total"] = total_time(total)
+        lines.extend(["-" * len(header),
+                      format_row("total (%d files)" % len(self.files), total)])
+        return lines
+
+
+class JavaScriptRenderMemo(object):
+    """An in-memory memo of the reStructuredText rendered from JavaScript
+    files. It is keyed by the hash of the file content and the normalized
+    options, so identical ``autojs`` directives are rendered once per build.
+    The least recently used entries are dropped when the memo outgrows
+    ``max_size`` characters. An output larger than that, or any output
+    without ``max_size``, is streamed into the directive without keeping it.
+    """
+
+    def __init__(self, max_size=None):
+        self.max_size = max_size
+        self.entries = OrderedDict()
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+
+    def to_rst(self, document, options):
+        """Returns ``document.to_rst(options)`` and sets the rendered
+        docstrings of the document as the call would.
+        """
+        return "\n".join(itertools.chain.from_iterable(
+            lines for lines, linenos in self.iter_rst(document, options)))
+
+    def iter_rst(self, document, options):
+        """Yields the chunks of ``document.iter_rst(options)`` and sets the
+        rendered docstrings of the document as the call would, once they are
+        all consumed.
+        """
+        if not self.max_size:
+            for chunk in document.iter_rst(options):
+                yield chunk
+            return
+        key = (document.digest, options_key(options))
+        try:
+            chunks, rendered, size = self.entries.pop(key)
+        except KeyError:
+            self.misses += 1
+            chunks = []
+            size = 0
+            for chunk in document.iter_rst(options):
+                if chunks is not None:
+                    size += sum(len(line) for line in chunk[0])
+                    if size > self.max_size:
+                        # too large to be kept
+                        chunks = None
+                    else:
+                        self.evict(size)
+                        chunks.append(chunk)
+                yield chunk
+            if chunks is None:
+                return
+            rendered = document.rendered
+        else:
+            self.hits += 1
+            self.size -= size
+            document.rendered = rendered
+            for chunk in chunks:
+                yield chunk
+        self.evict(size)
+        self.entries[key] = chunks, rendered, size
+        self.size += size
+
+    def evict(self, size=0):
+        """Drops the least recently used entries until ``size`` more
+        characters fit in ``max_size``.
+        """
+        while self.entries and self.size + size > self.max_size:
+            key, (chunks, rendered, entry_size) = \
+                self.entries.popitem(last=False)
+            self.size -= entry_size
+
+
+class JavaScriptIndex(object):
+    """The JavaScript files of a build. The parsed documents are kept in
+    memory during the build so that directives over the same file share them,
+    and the docstrings of the files under ``autojs_roots`` are indexed by
+    name to ``(path, offset, objtype, sig)``. The code blocks of the
+    docstrings in the documents being written are collected in
+    ``code_blocks`` for the :class:`JavaScriptHighlighter`.
+    """
+
+    def __init__(self, cache=None, mmap_threshold=None, memo_size=None,
+                 profile=None, shard_size=None, shard_workers=1,
+                 precompiled=False):
+        self.cache = cache
+        self.mmap_threshold = mmap_threshold
+        self.profile = profile
+        self.shard_size = shard_size
+        self.shard_workers = shard_workers
+        self.precompiled = precompiled
+        self.symbols = {}
+        self.documents = {}
+        self.memo = JavaScriptRenderMemo(memo_size)
+        self.code_blocks = set()
+
+    @classmethod
+    def from_env(cls, env):
+        profile = JavaScriptProfile() if env.config.autojs_profile else None
+        return cls(JavaScriptParseCache.from_env(env),
+                   env.config.autojs_mmap_threshold,
+                   env.config.autojs_render_memo_size, profile,
+                   env.config.autojs_shard_size,
+                   env.config.autojs_parse_workers,
+                   env.config.autojs_precompiled)
+
+    def __getstate__(self):
+        # the documents and the rendered output live only during the build
+        state = self.__dict__.copy()
+        state["documents"] = {}
+        state["code_blocks"] = set()
+        state["memo"] = JavaScriptRenderMemo(self.memo.max_size)
+        return state
+
+    def get_document(self, path):
+        path = os.path.abspath(path)
+        if path not in self.documents:
+            self.documents[path] = JavaScriptDocument(path, self.cache,
+                                                      self.mmap_threshold,
+                                                      self.profile,
+                                                      self.shard_size,
+                                                      self.shard_workers,
+                                                      self.precompiled)
+        return self.documents[path]
+
+    def preparse(self, paths, workers=1):
+        """Parses the files that are neither parsed, cached nor precompiled
+        yet. They are parsed in a pool of ``workers`` processes if there are
+        more than one, except the files scanned in shards, which have pools
+        of their own.
+        """
+        pending = []
+        queued = set()
+        for path in paths:
+            document = self.get_document(path)
+            if document._parsed is not None or document in queued:
+                continue
+            document._parsed = document.load()
+            if document._parsed is None:
+                queued.add(document)
+                if document.is_sharded(os.path.getsize(document.path)):
+                    document.parse()
+                else:
+                    pending.append(document)
+        futures = get_futures(workers, len(pending))
+        if futures is None:
+            for document in pending:
+                document.parse()
+            return
+        paths = [document.path for document in pending]
+        if self.profile is not None:
+            profiles = [JavaScriptProfile() for path in paths]
+        else:
+            profiles = [None] * len(paths)
+        with futures.ProcessPoolExecutor(workers) as executor:
+            results = executor.map(parse_file, paths,
+                                   [self.cache] * len(paths),
+                                   [self.mmap_threshold] * len(paths),
+                                   profiles)
+            for document, (parsed, profile) in zip(pending, results):
+                document._parsed = document.attach(parsed)
+                if self.profile is not None:
+                    self.profile.merge(profile)
+
+    def add_file(self, path):
+        document = self.get_document(path)
+        docstrings = document.parse()[1]
+        names = set(doc.name for doc in docstrings)
+        for doc in docstrings:
+            in_parent = any(name in names for name in doc.get_parent_names())
+            objtype = doc.guess_objtype(in_parent=in_parent)
+            self.symbols.setdefault(doc.name, (document.path, doc.offset,
+                                               objtype, doc.sig))
+
+    def find(self, name):
+        """Returns the ``(path, offset, objtype, sig)`` of the named docstring
+        or ``None``.
+        """
+        return self.symbols.get(name)
+
+
+class JavaScriptNodeRenderer(object):
+    """Builds the ``desc`` nodes of a :class:`JavaScriptDocument` directly
+    with the ``js`` domain directives.  Only the docstring bodies go through
+    the reStructuredText parser.  The nodes are not memoized, since each
+    directive registers its own targets and objects.
+    """
+
+    def __init__(self, directive):
+        self.directive = directive
+        self.state = directive.state
+        self.env = self.state.document.settings.env
+        self.directives = self.env.get_domain("js").directives
+        self.directive_classes = {}
+
+    def make_content(self, doc, dedent=False):
+        """Returns the body of a docstring as a :class:`ViewList` whose items
+        come from the lines of the JavaScript file.
+        """
+        lines, linenos = doc.get_body_lines()
+        if dedent:
+            # as docutils does with the content of a directive
+            indents = [len(line) - len(line.lstrip())
+                       for line in lines if line.strip()]
+            if indents and min(indents):
+                lines = [line[min(indents):] for line in lines]
+        content = ViewList()
+        for line, lineno in zip(lines, linenos):
+            if lineno is None:
+                content.append(line, "<autojs>")
+            else:
+                content.append(line, self.document.path, lineno)
+        return content
+
+    def render(self, document, options, node):
+        """Appends the nodes documenting ``document`` to ``node``."""
+        self.document = document
+        with document.timing("nest"):
+            self._render(document, options, node)
+
+    def _render(self, document, options, node):
+        document.rendered = []
+        if not options.get("exclude-desc"):
+            description = document.parse()[0]
+            if description is not None:
+                node = self.render_body(description, node)
+        for doc, index, is_member in document.iter_members(options):
+            objtype, sig = doc.get_subject()
+            if objtype is None:
+                document.rendered.append(doc)
+                node = self.render_body(doc, node)
+            else:
+                node.extend(self.render_docstring(doc, index, objtype, sig,
+                                                  is_member=is_member,
+                                                  rendered=document.rendered))
+
+    def render_body(self, doc, node):
+        """Parses a body outside of any object description and returns the
+        node that following nodes belong to, as titles open sections.
+        """
+        content = self.make_content(doc)
+        with self.document.timing("parse"), source_lines(self.state, content):
+            nested_parse_with_titles(self.state, content, node)
+        while len(node) and isinstance(node[-1], nodes.section):
+            node = node[-1]
+        return node
+
+    def render_docstring(self, doc, index, objtype, sig, is_member=None,
+                         rendered=None):
+        """Runs a ``.. js:<objtype>:: <sig>`` directive for a docstring and
+        nests the nodes of its members in its content.
+        """
+        if rendered is not None:
+            rendered.append(doc)
+        members = doc.find_members(index, objtype, is_member)
+        first = next(members, None)
+        # in reStructuredText the members are part of the content and keep
+        # it from being dedented
+        content = self.make_content(doc, dedent=first is None)
+        if first is not None:
+            members = itertools.chain([first], members)
+
+        def render_members():
+            result = []
+            for mem in members:
+                mem_objtype, mem_sig = mem.get_subject(doc)
+                result.extend(self.render_docstring(mem, index, mem_objtype,
+                                                    mem_sig,
+                                                    rendered=rendered))
+            return result
+
+        d = self.directive
+        directive = self.get_directive_class(objtype)(
+            "js:" + objtype, [sig], {}, content,
+            d.lineno, d.content_offset, d.block_text, d.state, d.state_machine)
+        directive.render_members = render_members
+        with self.document.timing("parse"), \
+             source_lines(self.state, content, d.content_offset):
+            result = directive.run()
+        for node in result:
+            if isinstance(node, addnodes.desc):
+                node.next_node(addnodes.desc_content).extend(directive.members)
+        return result
+
+    def get_directive_class(self, objtype):
+        """Returns a subclass of the ``js`` domain directive of ``objtype``
+        which renders the members of the docstring, by calling its
+        ``render_members``, as it leaves its content. The members are then
+        named within the object as if they were in its content.
+        """
+        try:
+            return self.directive_classes[objtype]
+        except KeyError:
+            pass
+        base = self.directives[objtype]
+
+        class NestingDirective(base):
+            def after_content(self):
+                self.members = self.render_members()
+                base.after_content(self)
+
+        self.directive_classes[objtype] = NestingDirective
+        return NestingDirective
+
 
 class AutoJavaScript(Directive):
     """ Generate reStructuredText from JavaScript file.
@@ -328,16 +2080,34 @@ class AutoJavaScript(Directive):
        .. autojs:: example.js
        .. autojs:: comment.js
 
+    The argument can also be a directory or a glob pattern. Then each file
+    gets a section:
+
+    .. sourcecode:: rest
+
+       .. autojs:: src/**/*.js
+
     """
 
     required_arguments = 1
     option_spec = {"exclude-desc": bool_option,
                    "members": members_option,
                    "exclude-members": members_option,
-                   "member-order": identity}
+                   "member-order": member_order_option}
+
+    def add_line(self, line, source="<autojs>", offset=0):
+        self.result.append(line, source, offset)
 
-    def add_line(self, line):
-        self.result.append(line, "<autojs>")
+    def add_source_lines(self, path, lines, linenos):
+        for line, lineno in zip(lines, linenos):
+            if lineno is None:
+                self.add_line(line)
+            else:
+                self.add_line(line, path, lineno)
+
+    def add_title(self, title):
+        rule = "=" * len(title)
+        self.add_lines(["", rule, title, rule, ""])
 
     def add_lines(self, lines):
         try:
@@ -355,14 +2125,584 @@ class AutoJavaScript(Directive):
     def run(self):
         self.result = ViewList()
         path = self.arguments[0]
-        filename = os.path.basename(path)
+        options = self.options
         node = nodes.section()
         node.document = self.state.document
-        self.add_lines(JavaScriptDocument(path).to_rst(self.options))
-        nested_parse_with_titles(self.state, self.result, node)
+        env = self.state.document.settings.env
+        index = env.autojs_index
+        symbol = index.find(path)
+        if symbol is not None and not os.path.exists(path):
+            # documents a docstring in autojs_roots by its name
+            options = dict(options, symbol=path)
+            options.setdefault("exclude-desc", True)
+            path = symbol[0]
+        base, paths = find_sources(path)
+        if not paths:
+            reporter = self.state.document.reporter
+            return [reporter.warning("No JavaScript file matches %r" % path,
+                                     line=self.lineno)]
+        has_sections = os.path.isdir(path) or glob.has_magic(path)
+        index.preparse(paths, env.config.autojs_parse_workers)
+        records = env.autojs_documents.setdefault(env.docname, [])
+        if has_sections:
+            records.append({"pattern": path, "paths": paths})
+        if env.config.autojs_render_nodes:
+            renderer = JavaScriptNodeRenderer(self)
+        else:
+            renderer = None
+        for path in paths:
+            document = index.get_document(path)
+            title = os.path.relpath(path, base or os.curdir)
+            if renderer is not None:
+                parent = node
+                if has_sections:
+                    parent = nodes.section()
+                    parent.document = self.state.document
+                renderer.render(document, options, parent)
+                records.append(document.make_record(options))
+                if has_sections and len(parent):
+                    self.add_section(node, parent, title)
+                continue
+            # the lines are added as they are rendered, with the lines of the
+            # file that they come from for the messages of docutils
+            blank = []
+            for lines, linenos in index.memo.iter_rst(document, options):
+                if has_sections and blank is not None:
+                    # the title is added with the first line that is not
+                    # blank, so that a file without one gets no section
+                    if not any(line.strip() for line in lines):
+                        blank.append((lines, linenos))
+                        continue
+                    self.add_title(title)
+                    for chunk in blank:
+                        self.add_source_lines(document.path, *chunk)
+                    blank = None
+                self.add_source_lines(document.path, lines, linenos)
+            records.append(document.make_record(options))
+            if self.result and index.profile is not None:
+                # each file is parsed on its own, so that the time is charged
+                # to it
+                with document.timing("parse"), \
+                     source_lines(self.state, self.result):
+                    nested_parse_with_titles(self.state, self.result, node)
+                self.result = ViewList()
+        if self.result:
+            # the files are parsed at once
+            with source_lines(self.state, self.result):
+                nested_parse_with_titles(self.state, self.result, node)
+        for block in node.traverse(is_code_block):
+            block["autojs"] = True
         return node.children
 
+    def add_section(self, node, section, title):
+        section.insert(0, nodes.title(title, title))
+        section["names"].append(nodes.fully_normalize_name(title))
+        self.state.document.note_implicit_target(section, section)
+        node.append(section)
+
+
+#: The script of a :class:`JavaScriptRuntime`. It reads a batch of examples
+#: as a JSON line, runs their file and then the examples one by one in a new
+#: context, and writes their outputs and the error of the file as a JSON
+#: line. The value of an example is printed unless it is ``undefined``, with
+#: strings quoted, and an exception as its message.
+NODE_WORKER = r"""
+var fs = require("fs");
+var vm = require("vm");
+var readline = require("readline");
+function describe(error) {
+    try {
+        return String(error);
+    } catch (e) {
+        return "Error";
+    }
+}
+function repr(value) {
+    if (typeof value === "string") {
+        return "'" + value.replace(/\\/g, "\\\\").replace(/'/g, "\\'")
+                          .replace(/\n/g, "\\n") + "'";
+    }
+    return String(value);
+}
+readline.createInterface({input: process.stdin}).on("line", function(line) {
+    var batch = JSON.parse(line), output = [], outputs = [], error = null;
+    var print = function() {
+        output.push(Array.prototype.map.call(arguments, String).join(" "));
+    };
+    var context = vm.createContext({
+        print: print,
+        console: {log: print, info: print, warn: print, error: print}
+    });
+    var options = {filename: batch.filename, timeout: batch.timeout};
+    try {
+        vm.runInContext(fs.readFileSync(batch.filename, "utf8"), context,
+                        options);
+    } catch (e) {
+        error = describe(e);
+    }
+    batch.examples.forEach(function(source) {
+        if (error !== null) {
+            return;
+        }
+        output = [];
+        try {
+            var value = vm.runInContext(source, context, options);
+            if (value !== undefined) {
+                output.push(repr(value));
+            }
+        } catch (e) {
+            output.push(describe(e));
+        }
+        outputs.push(output.join("\n"));
+    });
+    process.stdout.write(JSON.stringify({outputs: outputs, error: error}) +
+                         "\n");
+});
+"""
+
+
+class JavaScriptRuntime(object):
+    """A long-lived ``node`` process which runs batches of examples. The
+    examples of a batch share a context, as a session does.
+    """
+
+    def __init__(self, command, timeout=None):
+        self.command = command
+        self.timeout = timeout
+        self.process = None
+
+    def start(self):
+        try:
+            self.process = subprocess.Popen(
+                self.command + ["-e", NODE_WORKER],
+                stdin=subprocess.PIPE, stdout=subprocess.PIPE)
+        except OSError as exc:
+            raise SphinxError("Cannot run %r: %s" % (self.command[0], exc))
+
+    def run(self, filename, sources):
+        """Runs the file and then the examples, and returns the outputs of
+        the examples and the error of the file or ``None``. The process is
+        started again for the next batch if it dies.
+        """
+        if self.process is None:
+            self.start()
+        batch = {"filename": filename, "examples": sources}
+        if self.timeout:
+            batch["timeout"] = int(self.timeout * 1000)
+        try:
+            self.process.stdin.write(json.dumps(batch).encode("ascii") +
+                                     b"\n")
+            self.process.stdin.flush()
+            line = self.process.stdout.readline()
+        except (IOError, OSError):
+            line = b""
+        if not line:
+            self.close()
+            return [], "%s exited while running the examples" % \
+                       self.command[0]
+        result = json.loads(line.decode("utf-8"))
+        return result["outputs"], result["error"]
+
+    def close(self):
+        if self.process is None:
+            return
+        process, self.process = self.process, None
+        try:
+            process.stdin.close()
+        except (IOError, OSError):
+            pass
+        process.wait()
+
+
+class JavaScriptRuntimePool(object):
+    """A pool of ``size`` :class:`JavaScriptRuntime` processes which run the
+    batches concurrently. The processes are started on first use and live
+    until the pool is closed.
+    """
+
+    def __init__(self, command, size=1, timeout=None):
+        self.runtimes = [JavaScriptRuntime(command, timeout)
+                         for i in range(max(size, 1))]
+
+    def map(self, batches):
+        """Yields ``(outputs, error, elapsed)`` of each ``(filename,
+        sources)`` batch, in order.
+        """
+        batches = list(batches)
+        futures = get_futures(len(self.runtimes), len(batches))
+        if futures is None:
+            runtime = self.runtimes[0]
+            for filename, sources in batches:
+                yield self._run(runtime, filename, sources)
+            return
+        try:
+            import queue
+        except ImportError:
+            import Queue as queue
+        idle = queue.Queue()
+        for runtime in self.runtimes[:len(batches)]:
+            idle.put(runtime)
+        def run(batch):
+            runtime = idle.get()
+            try:
+                return self._run(runtime, *batch)
+            finally:
+                idle.put(runtime)
+        with futures.ThreadPoolExecutor(idle.qsize()) as executor:
+            for result in executor.map(run, batches):
+                yield result
+
+    def _run(self, runtime, filename, sources):
+        start = timer()
+        outputs, error = runtime.run(filename, sources)
+        return outputs, error, timer() - start
+
+    def close(self):
+        for runtime in self.runtimes:
+            runtime.close()
+
+
+class JavaScriptDoctestBuilder(Builder):
+    """Runs the examples of the docstrings documented by the ``autojs``
+    directives, as :mod:`sphinx.ext.doctest` does for Python. The examples of
+    each JavaScript file are run as one session in a pool of ``node``
+    processes. The failures and the time spent on each file are written to
+    ``output.txt``.
+    """
+
+    name = "jsdoctest"
+
+    def init(self):
+        self.total_tries = 0
+        self.total_failures = 0
+        self.setup_failures = 0
+        self.timings = []
+        date = time.strftime("%Y-%m-%d %H:%M:%S")
+        self.outfile = open(os.path.join(self.outdir, "output.txt"), "w")
+        self.outfile.write("Results of jsdoctest builder run on %s\n"
+                           "====================================%s\n"
+                           % (date, "=" * len(date)))
+
+    def get_target_uri(self, docname, typ=None):
+        return ""
+
+    def get_outdated_docs(self):
+        return self.env.found_docs
+
+    def _out(self, text):
+        logger.info(text)
+        self.outfile.write(text + "\n")
+
+    def collect_docstrings(self, docnames):
+        """Returns the :class:`JavaScriptDocument` and the documented
+        docstrings in source order of each JavaScript file which the
+        documents include.
+        """
+        index = self.env.autojs_index
+        files = OrderedDict()
+        for docname in sorted(docnames):
+            for record in self.env.autojs_documents.get(docname, []):
+                if "path" not in record:
+                    continue
+                document = index.get_document(record["path"])
+                description, docstrings = document.parse()
+                docs = files.setdefault(document.path, (document, {}))[1]
+                exclude_desc = record["options"][0]
+                if description is not None and not exclude_desc:
+                    docs[id(description)] = description
+                for doc in docstrings:
+                    if doc.name in record["names"]:
+                        docs[id(doc)] = doc
+        return [(document, sorted(docs.values(), key=lambda doc: doc.offset))
+                for document, docs in files.values()]
+
+    def write(self, build_docnames, updated_docnames, method="update"):
+        if build_docnames is None:
+            build_docnames = self.env.all_docs
+        batches = []
+        for document, docs in self.collect_docstrings(build_docnames):
+            examples = [(doc, example) for doc in docs
+                        for example in doc.get_examples()
+                        if not example.skip]
+            if examples:
+                batches.append((document, examples))
+        logger.info("running %d JavaScript files...", len(batches))
+        config = self.config
+        pool = JavaScriptRuntimePool([config.autojs_doctest_node],
+                                     config.autojs_doctest_workers,
+                                     config.autojs_doctest_timeout)
+        try:
+            results = pool.map((document.path,
+                                [example.source for doc, example in examples])
+                               for document, examples in batches)
+            for (document, examples), (outputs, error, elapsed) in \
+                    zip(batches, results):
+                self.report(document, examples, outputs, error, elapsed)
+        finally:
+            pool.close()
+
+    def report(self, document, examples, outputs, error, elapsed):
+        path = os.path.relpath(document.path, self.srcdir)
+        failures = 0
+        if error is not None:
+            # none of the examples is run
+            self.setup_failures += 1
+            self._out("File %r failed to run:\n%s\n"
+                      % (path, text_indent("    ", error)))
+        for (doc, example), got in zip(examples, outputs):
+            if example.check(got):
+                continue
+            failures += 1
+            start = doc.offset if doc.start is None else doc.start
+            lineno = document.get_lineno(start) + example.lineno
+            if example.want:
+                expected = "Expected:\n" + \
+                           text_indent("    ", "\n".join(example.want))
+            else:
+                expected = "Expected nothing"
+            self._out("File %r, line %d, in %s\nFailed example:\n%s\n"
+                      "%s\nGot:\n%s\n" % (
+                          path, lineno, doc.name or "the description",
+                          text_indent("    ", example.source), expected,
+                          text_indent("    ", got)))
+        self.total_tries += len(outputs)
+        self.total_failures += failures
+        self.timings.append((path, len(outputs), failures, elapsed))
+
+    def finish(self):
+        header = "%-40s %8s %8s %10s" % ("file", "tests", "failures", "ms")
+        lines = ["", "Timing", "======", header, "-" * len(header)]
+        for path, tries, failures, elapsed in sorted(
+                self.timings, key=lambda timing: -timing[3]):
+            lines.append("%-40s %8d %8d %10.1f" % (path[-40:], tries,
+                                                   failures, elapsed * 1000))
+        self.outfile.write("\n".join(lines) + "\n")
+        def s(number):
+            return "" if number == 1 else "s"
+        self._out("\nJavaScript doctest summary\n"
+                  "==========================\n"
+                  "%5d test%s in %d file%s\n%5d failure%s in tests\n"
+                  "%5d failure%s in running the files" % (
+                      self.total_tries, s(self.total_tries),
+                      len(self.timings), s(len(self.timings)),
+                      self.total_failures, s(self.total_failures),
+                      self.setup_failures, s(self.setup_failures)))
+        self.outfile.close()
+        if self.total_failures or self.setup_failures:
+            self.app.statuscode = 1
+
+
+def is_code_block(node):
+    return isinstance(node, (nodes.literal_block, nodes.doctest_block))
+
+
+def init_env(app):
+    if not hasattr(app.env, "autojs_documents"):
+        app.env.autojs_documents = {}
+    app.env.autojs_index = index = JavaScriptIndex.from_env(app.env)
+    paths = []
+    for root in app.config.autojs_roots:
+        paths.extend(find_files(os.path.join(app.confdir, root)))
+    index.preparse(paths, app.config.autojs_parse_workers)
+    for path in paths:
+        index.add_file(path)
+
+
+_AUTOJS_RE = re.compile(r"^[ \t]*\.\.[ \t]+autojs::[ \t]*(\S.*?)[ \t]*$",
+                        re.MULTILINE)
+
+
+def preparse_documents(app, env, docnames):
+    """Parses the JavaScript files of the ``autojs`` directives in the
+    documents to be read before reading them.
+    """
+    paths = []
+    for docname in docnames:
+        try:
+            with open(env.doc2path(docname)) as f:
+                source = f.read()
+        except (IOError, OSError, UnicodeDecodeError):
+            continue
+        for pattern in _AUTOJS_RE.findall(source):
+            paths.extend(find_sources(pattern)[1])
+    env.autojs_index.preparse(paths, app.config.autojs_parse_workers)
+
+
+def purge_documents(app, env, docname):
+    env.autojs_documents.pop(docname, None)
+
+
+def merge_documents(app, env, docnames, other):
+    if env.autojs_index.profile is not None:
+        env.autojs_index.profile.merge(other.autojs_index.profile)
+    for docname in docnames:
+        if docname in other.autojs_documents:
+            records = other.autojs_documents[docname]
+            env.autojs_documents[docname] = records
+
+
+def get_outdated_documents(app, env, added, changed, removed):
+    """Finds the documents which include a changed JavaScript file and whose
+    output would be changed by it.
+    """
+    outdated = []
+    for docname, records in env.autojs_documents.items():
+        if docname in added or docname in changed or docname in removed:
+            continue
+        for record in records:
+            if "pattern" in record:
+                if find_sources(record["pattern"])[1] != record["paths"]:
+                    outdated.append(docname)
+                    break
+                continue
+            path = record["path"]
+            try:
+                mtime = os.path.getmtime(path)
+            except OSError:
+                outdated.append(docname)
+                break
+            if mtime == record["mtime"]:
+                continue
+            if env.autojs_index.get_document(path).is_outdated(record):
+                outdated.append(docname)
+                break
+            record["mtime"] = mtime
+    return outdated
+
+
+def init_highlighter(app):
+    """Lets the highlighters of the builder take the code blocks of the
+    docstrings from the highlight cache.
+    """
+    cache = JavaScriptHighlightCache.from_env(app.env)
+    builder = app.builder
+    if cache is None or not hasattr(builder, "create_translator"):
+        return
+    code_blocks = app.env.autojs_index.code_blocks
+    def wrap(highlighter):
+        if highlighter is None or \
+           isinstance(highlighter, JavaScriptHighlighter):
+            return highlighter
+        return JavaScriptHighlighter(highlighter, cache, code_blocks)
+    if hasattr(builder, "highlighter"):
+        builder.highlighter = wrap(builder.highlighter)
+    create_translator = builder.create_translator
+    def create_highlighted_translator(*args):
+        # the LaTeX translator makes its own highlighter
+        translator = create_translator(*args)
+        if hasattr(translator, "highlighter"):
+            translator.highlighter = wrap(translator.highlighter)
+        return translator
+    builder.create_translator = create_highlighted_translator
+
+
+def collect_code_blocks(app, doctree, docname):
+    code_blocks = app.env.autojs_index.code_blocks
+    for block in doctree.traverse(is_code_block):
+        if block.get("autojs"):
+            code_blocks.add(block.rawsource)
+            code_blocks.add(block.astext())
+
+
+def evict_caches(app, exception):
+    for cache_cls in (JavaScriptParseCache, JavaScriptHighlightCache):
+        cache = cache_cls.from_env(app.env)
+        if cache is not None:
+            cache.evict()
+
+
+def report_render_memo(app, exception):
+    memo = app.env.autojs_index.memo
+    if memo.hits or memo.misses:
+        logger.verbose("autojs render memo: %d hits, %d misses",
+                       memo.hits, memo.misses)
+
+
+def report_profile(app, exception):
+    profile = app.env.autojs_index.profile
+    if profile is None or not profile.files or exception is not None:
+        return
+    for line in profile.format_table(app.srcdir):
+        logger.info(line)
+    path = os.path.join(app.outdir, "autojs-profile.json")
+    with open(path, "w") as f:
+        json.dump(profile.to_json(), f, indent=2, sort_keys=True)
+    logger.info("autojs profile written to %s", path)
+
+
+def main(argv=None):
+    """The ``autojs-precompile`` command. It writes the precompiled files of
+    JavaScript files, which the ``autojs`` directive loads instead of parsing
+    the files.
+    """
+    import argparse
+    parser = argparse.ArgumentParser(
+        prog="autojs-precompile",
+        description="Precompiles the docstrings of JavaScript files for the "
+                    "autojs directive of Sphinx.")
+    parser.add_argument("patterns", nargs="+", metavar="path",
+                        help="a JavaScript file, a directory or a glob "
+                             "pattern")
+    parser.add_argument("-j", "--jobs", type=int, default=1,
+                        help="the number of processes (default: 1)")
+    parser.add_argument("--mmap-threshold", type=int,
+                        default=4 * 1024 * 1024,
+                        help="as autojs_mmap_threshold, which must be the "
+                             "same in the Sphinx build (default: 4 MiB)")
+    args = parser.parse_args(argv)
+    paths = []
+    for pattern in args.patterns:
+        for path in find_sources(pattern)[1]:
+            if path not in paths:
+                paths.append(path)
+    if not paths:
+        parser.error("no JavaScript file matches")
+    futures = get_futures(args.jobs, len(paths))
+    thresholds = [args.mmap_threshold] * len(paths)
+    if futures is None:
+        counts = map(precompile_file, paths, thresholds)
+        for path, count in zip(paths, counts):
+            print("%s: %d docstrings" % (path, count))
+        return 0
+    with futures.ProcessPoolExecutor(args.jobs) as executor:
+        counts = executor.map(precompile_file, paths, thresholds)
+        for path, count in zip(paths, counts):
+            print("%s: %d docstrings" % (path, count))
+    return 0
+
 
 def setup(app):
+    app.add_config_value("autojs_cache", True, "")
+    app.add_config_value("autojs_cache_size", 64 * 1024 * 1024, "")
+    app.add_config_value("autojs_mmap_threshold", 4 * 1024 * 1024, "")
+    app.add_config_value("autojs_roots", [], "env")
+    app.add_config_value("autojs_parse_workers", 1, "")
+    app.add_config_value("autojs_shard_size", None, "")
+    app.add_config_value("autojs_precompiled", True, "")
+    app.add_config_value("autojs_render_nodes", False, "env")
+    app.add_config_value("autojs_render_memo_size", 16 * 1024 * 1024, "")
+    app.add_config_value("autojs_highlight_cache", True, "")
+    app.add_config_value("autojs_highlight_cache_size", 64 * 1024 * 1024, "")
+    app.add_config_value("autojs_profile", False, "")
+    app.add_config_value("autojs_doctest_node", "node", "")
+    app.add_config_value("autojs_doctest_workers", 1, "")
+    app.add_config_value("autojs_doctest_timeout", 5, "", (int, float))
+    app.add_directive_to_domain("js", "class", JSClassConstructor)
+    # Adds js:method directive and js:meth role
+    for objtype in ("member", "attribute", "method", "staticmethod"):
+        app.add_directive_to_domain("js", objtype, JSClassmember)
+    app.add_role_to_domain("js", "meth", JSXRefRole(fix_parens=True))
     app.add_directive('autojs', AutoJavaScript)
+    app.add_builder(JavaScriptDoctestBuilder)
     app.add_lexer("jscon", JavascriptConsoleLexer())
+    app.connect("builder-inited", init_env)
+    app.connect("builder-inited", init_highlighter)
+    app.connect("env-purge-doc", purge_documents)
+    app.connect("env-get-outdated", get_outdated_documents)
+    app.connect("env-before-read-docs", preparse_documents)
+    app.connect("env-merge-info", merge_documents)
+    app.connect("doctree-resolved", collect_code_blocks)
+    app.connect("build-finished", evict_caches)
+    app.connect("build-finished", report_render_memo)
+    app.connect("build-finished", report_profile)
+    return {"parallel_read_safe": True, "parallel_write_safe": True}
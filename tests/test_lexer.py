@@ -0,0 +1,86 @@
+"""
+Differential tests of the console lexer
+~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+:class:`JavascriptConsoleLexer` has to give the tokens of a ``jscon`` session
+that lexing the whole session at once gave, as autojs did before, except that
+the tokens of an output are merged.
+"""
+import random
+
+import pytest
+from pygments.lexers.javascript import JavascriptLexer
+from pygments.token import Generic, Name
+
+from sphinxcontrib.autojs import JavascriptConsoleLexer
+
+
+class OldConsoleLexer(JavascriptConsoleLexer):
+    """The console lexer of autojs before the session was split."""
+
+    def get_tokens_unprocessed(self, text):
+        is_example = False
+        is_output = False
+        for item in JavascriptLexer.get_tokens_unprocessed(self, text):
+            if item[1] is Generic.Prompt:
+                is_example = True
+                is_output = False
+            elif is_example and item[2].endswith(u"\n"):
+                is_example = False
+                is_output = True
+            elif is_output:
+                item = item[0], Generic.Output, item[2]
+            elif item[2] in self.EXCEPTIONS:
+                item = item[0], Name.Exception, item[2]
+            yield item
+
+
+SESSIONS = [
+    ">>> var title = $( \"h1\" );\n"
+    ">>> title.click(function() {\n"
+    "...     alert( this.innerText );\n"
+    "... });\n"
+    "[object Object]\n"
+    ">>> Math.round( 1.11111111 );\n"
+    "1\n",
+    ">>> x /* a\n... b */ + 1\n2\n",
+    ">>> var s = `a\n... b ${ 1 +\n... 2 }`;\n\"a\\n... b 3\"\n",
+    "var a = 1;\n>>> a;\n1\n>>> throw new Error(\"x\");\nError: x\n",
+    ">>> f(\n... 1,\n... 2);\n3\nmore output\n\n>>> g();\n"
+    "ReferenceError: g is not defined\n",
+    ">>> 1\n1",
+    "",
+]
+
+
+def make_session(seed, size):
+    rng = random.Random(seed)
+    lines = []
+    for i in range(size):
+        lines.append(">>> var x%d = f( %d, 'str', /re/g ) / 2; // c" % (i, i))
+        if rng.random() < 0.3:
+            lines.append("... + `t ${ x } t`")
+        if rng.random() < 0.2:
+            lines.append("... /* c\n... d */ + 1;")
+        for j in range(rng.randrange(3)):
+            lines.append(rng.choice(["%d" % i, "Error: %d" % i, "'s'",
+                                     "KeyError", ""]))
+    return "\n".join(lines) + "\n"
+
+
+def get_tokens(lexer, text):
+    tokens = []
+    for index, token, value in lexer.get_tokens_unprocessed(text):
+        if tokens and token is Generic.Output is tokens[-1][0]:
+            tokens[-1] = token, tokens[-1][1] + value
+        else:
+            tokens.append((token, value))
+    return tokens
+
+
+@pytest.mark.parametrize("text", SESSIONS + [make_session(seed, 200)
+                                             for seed in range(3)])
+def test_lexer_matches_whole_session(text):
+    tokens = get_tokens(JavascriptConsoleLexer(), text)
+    assert tokens == get_tokens(OldConsoleLexer(), text)
+    assert "".join(value for token, value in tokens) == text
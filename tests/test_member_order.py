@@ -0,0 +1,75 @@
+"""
+Differential tests of the member order
+~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+The sort keys of ``:member-order:`` have to order the docstrings as the
+comparison functions that autojs sorted them with before.
+"""
+import functools
+import random
+
+import pytest
+
+from sphinxcontrib.autojs import ALL, JavaScriptDocument, member_order_option
+
+
+DIRECTIVES = ["", "class", "function", "data", "attribute", "method",
+              "staticmethod", "member"]
+
+
+def make_source(seed, size):
+    rng = random.Random(seed)
+    chunks = []
+    for i in range(size):
+        name = rng.choice(["Alpha", "beta", "Gamma", "delta"])
+        if rng.random() < 0.6:
+            name += rng.choice([".prototype.", ".", "_"]) + \
+                    rng.choice(["run", "size", "Zeta", "each"])
+        # some names are the same, so that the sort has to be stable
+        sig = name + rng.choice(["", "()", "( a )"])
+        chunks.append("/**%s:%s\n\nThe docstring %d.\n*/"
+                      % (rng.choice(DIRECTIVES), sig, i))
+    return "\n".join(chunks) + "\n"
+
+
+def old_comparer(member_order):
+    """The comparison function of autojs before the sort keys."""
+    if not member_order or member_order == "alphabetical":
+        return lambda d1, d2: (d1.name > d2.name) - (d1.name < d2.name)
+    elif member_order == "groupwise":
+        order = ["class", "member", "attribute", "method", "staticmethod",
+                 "data", "function"]
+        def compare(d1, d2):
+            i1 = order.index(d1.guess_objtype())
+            i2 = order.index(d2.guess_objtype())
+            return (i1 > i2) - (i1 < i2) or old_comparer(None)(d1, d2)
+        return compare
+
+
+@pytest.mark.parametrize("seed", range(5))
+@pytest.mark.parametrize("member_order", [None, "alphabetical", "groupwise"])
+def test_sort_key_matches_comparer(tmpdir, seed, member_order):
+    path = tmpdir.join("members.js")
+    path.write(make_source(seed, 200))
+    document = JavaScriptDocument(str(path))
+    docstrings = document.parse()[1]
+    key = document._make_sort_key(member_order)
+    compare = old_comparer(member_order)
+    assert sorted(docstrings, key=key) == \
+           sorted(docstrings, key=functools.cmp_to_key(compare))
+
+
+def test_bysource_keeps_source_order(tmpdir):
+    path = tmpdir.join("members.js")
+    path.write("".join("/**:Name%d\n\nThe docstring.\n*/\n" % i
+                       for i in (3, 1, 2)))
+    document = JavaScriptDocument(str(path))
+    options = {"members": ALL, "member-order": "bysource"}
+    assert [doc.name for doc, index, is_member
+            in document.iter_members(options)] == ["Name3", "Name1", "Name2"]
+
+
+def test_unknown_member_order():
+    assert member_order_option("groupwise") == "groupwise"
+    with pytest.raises(ValueError):
+        member_order_option("nosuch")
@@ -0,0 +1,75 @@
+"""
+Differential tests of the member selection
+~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+:class:`JavaScriptPrefixTrie` has to match the names which start with one of
+its prefixes, and ``:members:`` and ``:exclude-members:`` have to select the
+docstrings that the linear matching of autojs selected before.
+"""
+import random
+
+import pytest
+
+from sphinxcontrib.autojs import ALL, JavaScriptDocument, JavaScriptPrefixTrie
+
+
+PARTS = ["Image", "ImageFile", "File", "prototype", "fetch", "fetchData", "x"]
+
+
+def make_name(rng):
+    return ".".join(rng.choice(PARTS) for i in range(rng.randrange(1, 4)))
+
+
+def make_prefix(rng):
+    name = make_name(rng)
+    # a prefix may end in the middle of a part
+    return name[:rng.randrange(len(name) + 1)]
+
+
+def old_member_checker(members, exclude_members):
+    """The member checker of autojs before the prefix trie."""
+    __members__ = members
+    def is_member(doc, members=None):
+        if members is None:
+            members = __members__
+        if members is not exclude_members and \
+           is_member(doc, exclude_members):
+            return False
+        elif members is ALL or doc.name in members:
+            return True
+        for mem in members:
+            if doc.name.startswith(mem):
+                return True
+        return False
+    return is_member
+
+
+class Doc(object):
+
+    def __init__(self, name):
+        self.name = name
+
+
+@pytest.mark.parametrize("seed", range(10))
+def test_trie_matches_startswith(seed):
+    rng = random.Random(seed)
+    prefixes = [make_prefix(rng) for i in range(rng.randrange(5))]
+    trie = JavaScriptPrefixTrie(prefixes)
+    for i in range(500):
+        name = make_name(rng)
+        assert trie.match(name) == \
+               any(name.startswith(prefix) for prefix in prefixes)
+
+
+@pytest.mark.parametrize("seed", range(10))
+def test_member_checker_matches_linear(seed):
+    rng = random.Random(seed)
+    members = rng.choice([ALL, [make_name(rng) for i in range(3)]])
+    exclude_members = rng.choice([[], members,
+                                  [make_prefix(rng) for i in range(2)]])
+    document = JavaScriptDocument("members.js")
+    is_member = document._make_member_checker(members, exclude_members)
+    old_is_member = old_member_checker(members, exclude_members)
+    for i in range(500):
+        doc = Doc(make_name(rng))
+        assert is_member(doc) == old_is_member(doc)
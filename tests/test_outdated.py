@@ -0,0 +1,101 @@
+"""
+Differential tests of the outdated documents
+~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+A document which includes a JavaScript file has to be read again exactly when
+an edit of the file changes the reStructuredText rendered for it, and the
+parse cache has to give the docstrings of the file as it is now.
+"""
+import os
+
+import pytest
+
+from sphinxcontrib.autojs import ALL, JavaScriptDocument, \
+                                 JavaScriptParseCache, JavaScriptProfile
+
+
+def make_source(classes=4):
+    chunks = ["/**\n\nThe module.\n*/"]
+    for i in range(1, classes + 1):
+        chunks.append("var Class%d = function() {\n"
+                      "    /**class:Class%d()\n\n"
+                      "    The class %d.\n"
+                      "    */\n"
+                      "};" % (i, i, i))
+        for j in range(3):
+            chunks.append("Class%d.prototype.method%d = function() {\n"
+                          "    /**:Class%d.prototype.method%d()\n\n"
+                          "    The method %d of the class %d.\n"
+                          "    */\n"
+                          "    return %d;\n"
+                          "};" % (i, j, i, j, j, i, j))
+    return "\n".join(chunks) + "\n"
+
+
+EDITS = [("code", "};\nvar Class3", "};\nvar x = 1;\nvar Class3"),
+         ("description", "The module.", "The edited module."),
+         ("rendered", "The method 1 of the class 1.", "Edited."),
+         ("other", "The method 1 of the class 3.", "Edited."),
+         ("removed", "    /**:Class2.prototype.method2()\n", "    /*\n"),
+         ("member", "};\nvar Class2",
+          "};\n/**:Class1.prototype.added\n\nAdded.\n*/\nvar Class2"),
+         ("class", "var Class2",
+          "/**class:Class9()\n\nAdded.\n*/\nvar Class2")]
+
+OPTIONS = [{"members": ALL},
+           {"members": ["Class1"]},
+           {"members": ALL, "exclude-members": ["Class2"]},
+           {"members": ["Class1.prototype.method1"], "exclude-desc": True}]
+
+
+def write(path, source, mtime):
+    path.write(source)
+    os.utime(str(path), (mtime, mtime))
+
+
+@pytest.mark.parametrize("options", OPTIONS)
+@pytest.mark.parametrize("name,old,new", EDITS)
+def test_outdated_iff_output_changed(tmpdir, options, name, old, new):
+    source = make_source()
+    assert source.count(old) == 1
+    path = tmpdir.join("module.js")
+    write(path, source, 1000000000)
+    document = JavaScriptDocument(str(path))
+    rst = document.to_rst(options)
+    record = document.make_record(options)
+    write(path, source.replace(old, new), 1000000100)
+    edited = JavaScriptDocument(str(path))
+    assert edited.is_outdated(record) == (edited.to_rst(options) != rst)
+
+
+def describe(parsed):
+    description, docstrings = parsed
+    return [(doc.name, doc.sig, doc.directive, doc.offset, doc.body)
+            for doc in [description] + docstrings]
+
+
+def parse(path, cache=None):
+    profile = JavaScriptProfile()
+    document = JavaScriptDocument(str(path), cache, profile=profile)
+    parsed = describe(document.parse())
+    return parsed, profile.get_file(str(path))["bytes"]
+
+
+@pytest.mark.parametrize("name,old,new", EDITS)
+def test_cache_matches_parse(tmpdir, name, old, new):
+    cache = JavaScriptParseCache(str(tmpdir.join("cache")))
+    source = make_source()
+    path = tmpdir.join("module.js")
+    write(path, source, 1000000000)
+    parse(path, cache)
+    # an unchanged file is not scanned again
+    parsed, scanned = parse(path, cache)
+    assert parsed == parse(path)[0]
+    assert scanned == 0
+    write(path, source.replace(old, new), 1000000100)
+    assert parse(path, cache)[0] == parse(path)[0]
+    # nor is a file which was only touched
+    write(path, source.replace(old, new), 1000000200)
+    parsed, scanned = parse(path, cache)
+    assert parsed == parse(path)[0]
+    assert scanned == 0
@@ -0,0 +1,92 @@
+"""
+Differential tests of the precompiled files
+~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+The docstrings loaded from the file that ``autojs-precompile`` wrote next to
+a JavaScript file have to be the ones that parsing the file gives, and a file
+which does not fit the source any more has to be ignored.
+"""
+import io
+import random
+
+import pytest
+
+from sphinxcontrib.autojs import ALL, JavaScriptDocument, main
+
+
+def make_source(seed, size, word=u"naive"):
+    rng = random.Random(seed)
+    chunks = [u"/**\n\nThe module, %s.\n*/" % word]
+    for i in range(size):
+        indent = u" " * rng.choice([0, 4])
+        name = u"Name%d" % (i % 5)
+        if rng.random() < 0.7:
+            name += u".prototype.member%d" % i
+        chunks.append(u"%s/**%s:%s%s\n\n%sThe docstring %d, %s.\n\n"
+                      u"%s    >>> f( %d );\n%s*/"
+                      % (indent, rng.choice([u"", u"class", u"function"]),
+                         name, rng.choice([u"", u"()", u"( a )"]), indent, i,
+                         word, indent, i, indent))
+        if rng.random() < 0.1:
+            chunks.append(u"var t = `\n/**:InTemplate%d\n\nMaybe.\n*/`;" % i)
+    return u"\n".join(chunks) + u"\n"
+
+
+def write(path, source):
+    with io.open(str(path), "w", encoding="utf-8") as f:
+        f.write(source)
+
+
+def describe(parsed):
+    description, docstrings = parsed
+    return [(doc.indent, doc.name, doc.sig, doc.directive, doc.offset,
+             doc.body) for doc in [description] + docstrings]
+
+
+@pytest.mark.parametrize("seed", range(3))
+@pytest.mark.parametrize("mmap_threshold", [None, 1])
+def test_precompiled_matches_parse(tmpdir, seed, mmap_threshold):
+    path = tmpdir.join("module.js")
+    # the spans of a memory-mapped source are in bytes, which differ from the
+    # characters in non-ASCII text, and the other sources are read in the
+    # encoding of the locale
+    word = u"na\xefve" if mmap_threshold else u"naive"
+    write(path, make_source(seed, 100, word))
+    count = JavaScriptDocument(str(path), mmap_threshold=mmap_threshold) \
+            .save_precompiled()
+    document = JavaScriptDocument(str(path), mmap_threshold=mmap_threshold)
+    loaded = JavaScriptDocument(str(path), mmap_threshold=mmap_threshold,
+                                precompiled=True)
+    parsed = loaded.load_precompiled()
+    assert parsed is not None
+    assert len(parsed[1]) == count
+    assert describe(parsed) == describe(document.parse())
+    options = {"members": ALL}
+    assert loaded.to_rst(options) == document.to_rst(options)
+
+
+def test_stale_precompiled_is_ignored(tmpdir):
+    path = tmpdir.join("module.js")
+    source = make_source(0, 10)
+    write(path, source)
+    JavaScriptDocument(str(path)).save_precompiled()
+    # the spans are in bytes in a memory-mapped source
+    assert JavaScriptDocument(str(path), mmap_threshold=1) \
+           .load_precompiled() is None
+    write(path, source.replace(u"The docstring 5", u"The edited docstring"))
+    document = JavaScriptDocument(str(path), precompiled=True)
+    assert document.load_precompiled() is None
+    assert describe(document.parse()) == \
+           describe(JavaScriptDocument(str(path)).parse())
+
+
+def test_precompile_command(tmpdir, capsys):
+    for i in range(3):
+        write(tmpdir.join("module%d.js" % i), make_source(i, 10))
+    assert main(["-j", "2", str(tmpdir)]) == 0
+    assert len(capsys.readouterr().out.splitlines()) == 3
+    for i in range(3):
+        path = str(tmpdir.join("module%d.js" % i))
+        parsed = JavaScriptDocument(path, precompiled=True).load_precompiled()
+        assert describe(parsed) == \
+               describe(JavaScriptDocument(path).parse())
@@ -0,0 +1,75 @@
+"""
+Differential tests of the render memo
+~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+:class:`JavaScriptRenderMemo` has to give what the documents render, and set
+the rendered docstrings as they do, whether the output was memoized or not.
+"""
+from sphinxcontrib.autojs import ALL, JavaScriptDocument, JavaScriptRenderMemo
+
+
+OPTIONS = {"members": ALL}
+
+
+def make_documents(tmpdir, count):
+    documents = []
+    for i in range(count):
+        path = tmpdir.join("module%d.js" % i)
+        path.write("".join("/**:Module%d.member%d\n\nThe member %d.\n*/\n"
+                           % (i, j, j) for j in range(10)))
+        documents.append(JavaScriptDocument(str(path)))
+    return documents
+
+
+def get_size(document, options=OPTIONS):
+    return sum(len(line) for lines, linenos in document.iter_rst(options)
+               for line in lines)
+
+
+def check(memo, document, options=OPTIONS):
+    rst = memo.to_rst(document, options)
+    # a hit may come from another file with the same content, and only the
+    # names of the rendered docstrings are recorded
+    names = [doc.name for doc in document.rendered]
+    assert rst == document.to_rst(options)
+    assert names == [doc.name for doc in document.rendered]
+
+
+def test_hits(tmpdir):
+    first, second = make_documents(tmpdir, 2)
+    memo = JavaScriptRenderMemo(10 * get_size(first))
+    check(memo, first)
+    check(memo, first)
+    check(memo, second)
+    check(memo, first, {"members": ["Module0.member1"]})
+    assert (memo.hits, memo.misses) == (1, 3)
+    # the same content in another file is a hit
+    copy = tmpdir.join("copy.js")
+    copy.write(tmpdir.join("module0.js").read())
+    check(memo, JavaScriptDocument(str(copy)))
+    assert (memo.hits, memo.misses) == (2, 3)
+
+
+def test_evicts_least_recently_used(tmpdir):
+    documents = make_documents(tmpdir, 3)
+    size = get_size(documents[0])
+    memo = JavaScriptRenderMemo(2 * size)
+    check(memo, documents[0])
+    check(memo, documents[1])
+    check(memo, documents[0])
+    check(memo, documents[2])
+    assert memo.size <= memo.max_size
+    assert [key[0] for key in memo.entries] == \
+           [documents[0].digest, documents[2].digest]
+    check(memo, documents[1])
+    assert (memo.hits, memo.misses) == (1, 4)
+
+
+def test_streams_large_outputs(tmpdir):
+    document, = make_documents(tmpdir, 1)
+    for max_size in [0, None, get_size(document) - 1]:
+        memo = JavaScriptRenderMemo(max_size)
+        check(memo, document)
+        check(memo, document)
+        assert not memo.entries
+        assert memo.size == memo.hits == 0
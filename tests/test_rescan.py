@@ -0,0 +1,66 @@
+"""
+Differential tests of the rescan of edited files
+~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+When a cached file is edited, scanning only the part between its unchanged
+regions again has to give the docstrings that scanning the whole file gives.
+"""
+import os
+
+import pytest
+
+from sphinxcontrib.autojs import JavaScriptDocument, JavaScriptParseCache, \
+                                 JavaScriptProfile
+
+
+def make_source(size=1000):
+    chunks = ["/**\n\nThe module.\n*/"]
+    for i in range(size):
+        chunks.append("/**:Name%d.member%d( a )\n\nThe docstring %d.\n\n"
+                      "    >>> f( %d );\n    %d\n*/\nvar x%d = %d;"
+                      % (i // 10, i, i, i, i, i, i))
+    return "\n".join(chunks) + "\n"
+
+
+EDITS = [("body", "The docstring 500.", "The edited docstring."),
+         ("inserted", "var x500 = 500;",
+          "var x500 = 500;\n/**:Inserted\n\nNew.\n*/"),
+         ("removed", "/**:Name50.member500( a )", "/*:Name50.member500( a )"),
+         ("code", "var x500 = 500;", "var x500 = 'a longer value';"),
+         ("start", "The module.", "The edited module."),
+         ("end", "The docstring 999.", "The edited docstring."),
+         ("comment", "var x500 = 500;", "var x500 = 500; /*"),
+         ("everywhere", "The docstring", "The edited docstring")]
+
+
+def describe(parsed):
+    description, docstrings = parsed
+    return [(doc.indent, doc.name, doc.sig, doc.directive, doc.offset,
+             doc.body) for doc in [description] + docstrings]
+
+
+def parse(path, cache=None, mmap_threshold=None):
+    profile = JavaScriptProfile()
+    document = JavaScriptDocument(str(path), cache, mmap_threshold, profile)
+    parsed = describe(document.parse())
+    return parsed, profile.get_file(str(path))["bytes"]
+
+
+@pytest.mark.parametrize("mmap_threshold", [None, 1])
+@pytest.mark.parametrize("name,old,new", EDITS)
+def test_rescan_matches_full_scan(tmpdir, mmap_threshold, name, old, new):
+    cache = JavaScriptParseCache(str(tmpdir.join("cache")))
+    source = make_source()
+    path = tmpdir.join("module.js")
+    path.write(source)
+    os.utime(str(path), (1000000000, 1000000000))
+    parse(path, cache, mmap_threshold)
+    edited = source.replace(old, new)
+    path.write(edited)
+    rescanned, scanned = parse(path, cache, mmap_threshold)
+    assert rescanned == parse(path, None, mmap_threshold)[0]
+    if name in ("body", "inserted", "removed", "code"):
+        # only the regions around the edit are scanned again
+        assert 0 < scanned < len(edited) // 2
+    # and the rescanned file is cached again
+    assert parse(path, cache, mmap_threshold) == (rescanned, 0)
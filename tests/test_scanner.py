@@ -0,0 +1,102 @@
+"""
+Differential tests of the docstring scanner
+~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+:class:`JavaScriptScanner` has to find the same docstrings as matching
+``_DOCSTRING_RE`` over the whole source, as autojs did before it, wherever no
+``/**`` hides in a literal.
+"""
+import random
+
+import pytest
+
+from sphinxcontrib.autojs import JavaScriptDocstring, JavaScriptDocument
+
+
+DIRECTIVES = ["", "class", "function", "data", "attribute", "method",
+              "staticmethod"]
+CODE = ["var x = 1;",
+        "var s = 'a string', t = \"another\";",
+        "var y = x / 2 / 3;",
+        "var r = /[/*]+/g;",
+        "if (x) { y = { a: [1, 2] }; }",
+        "var u = `template ${ x + `nested ${ y }` } end`;",
+        "// a line comment",
+        "/* a block comment */",
+        "/**/",
+        "function f(a, b) {\n    return a * b;\n}"]
+
+
+def make_docstring(rng, i):
+    indent = " " * rng.choice([0, 0, 2, 4])
+    name = "Name%d" % i
+    if rng.random() < 0.5:
+        name += ".prototype.member%d" % rng.randrange(100)
+    sig = name + rng.choice(["", "()", "( a, b )"])
+    # a body which is blank would make the regular expression run to the
+    # end of the next comment
+    lines = ["%s/**%s: %s" % (indent, rng.choice(DIRECTIVES), sig), "",
+             indent + "The docstring %d." % i]
+    for j in range(rng.randrange(1, 6)):
+        lines.append(indent + rng.choice(["Some text.", "",
+                                          "    >>> f( %d );" % j,
+                                          "    %d" % j, "Code::", ""]))
+    lines.append(indent + "*/")
+    return "\n".join(lines)
+
+
+def make_corpus(seed, size):
+    rng = random.Random(seed)
+    chunks = []
+    for i in range(size):
+        for j in range(rng.randrange(3)):
+            chunks.append(rng.choice(CODE))
+        chunks.append(make_docstring(rng, i))
+    return "\n".join(chunks) + "\n"
+
+
+def describe(doc):
+    return (doc.indent, doc.name, doc.sig, doc.directive, doc.offset,
+            doc.body)
+
+
+def scan(path, mmap_threshold=None):
+    document = JavaScriptDocument(str(path), mmap_threshold=mmap_threshold)
+    return [describe(doc) for doc in document.get_docstrings()]
+
+
+def match(source):
+    return [describe(JavaScriptDocstring.from_match(match))
+            for match in JavaScriptDocument._DOCSTRING_RE.finditer(source)]
+
+
+@pytest.mark.parametrize("seed,size", [(0, 10), (1, 100), (2, 1000)])
+def test_scanner_matches_regex(tmpdir, seed, size):
+    source = make_corpus(seed, size)
+    path = tmpdir.join("corpus.js")
+    path.write(source)
+    expected = match(source)
+    assert len(expected) == size
+    assert scan(path) == expected
+
+
+def test_scanner_matches_regex_when_mapped(tmpdir):
+    source = make_corpus(3, 100)
+    path = tmpdir.join("corpus.js")
+    path.write(source)
+    mapped = scan(path, mmap_threshold=1)
+    # the offsets of a memory-mapped source are in bytes, which are the
+    # characters of an ASCII source
+    assert mapped == match(source)
+
+
+def test_scanner_skips_literals(tmpdir):
+    source = ("var s = '/**:NotInString\\n\\nNo.\\n*/';\n"
+              "var r = /\\/**:NotInRegex/;\n"
+              "var t = `/**:NotInTemplate\n\nNo.\n*/`;\n"
+              "// /**:NotInComment\n"
+              "/**:Real\n\nYes.\n*/\n")
+    path = tmpdir.join("literals.js")
+    path.write(source)
+    assert [name for indent, name, sig, directive, offset, body
+            in scan(path)] == ["Real"]
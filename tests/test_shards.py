@@ -0,0 +1,59 @@
+"""
+Differential tests of the sharded scan
+~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+Scanning a memory-mapped source in shards has to find the same docstrings as
+scanning it at once, also when a literal or a comment crosses the end of a
+shard.
+"""
+import random
+
+import pytest
+
+from sphinxcontrib.autojs import JavaScriptDocument
+
+
+def make_source(seed, size, literals=False):
+    rng = random.Random(seed)
+    chunks = ["/**\n\nThe module.\n*/"]
+    for i in range(size):
+        indent = " " * rng.choice([0, 0, 4])
+        chunks.append("%s/**%s:Name%d.member%d\n\n%sThe docstring %d.\n%s*/"
+                      % (indent, rng.choice(["", "function", "attribute"]),
+                         i % 7, i, indent, i, indent))
+        chunks.append(rng.choice(["var x = 1;", "// /**:NotInComment",
+                                  "var s = '/**:NotInString';", ""]))
+        if literals and rng.random() < 0.2:
+            # a line which looks like the start of a docstring
+            chunks.append(rng.choice(["/*\n/**:NotInComment\n*/",
+                                      "var t = `\n/**:NotInTemplate\n*/`;"]))
+    return "\n".join(chunks) + "\n"
+
+
+def describe(parsed):
+    description, docstrings = parsed
+    return [(doc.indent, doc.name, doc.sig, doc.directive, doc.offset,
+             doc.body) for doc in [description] + docstrings]
+
+
+def parse(path, **kwargs):
+    return describe(JavaScriptDocument(str(path), mmap_threshold=1,
+                                       **kwargs).parse())
+
+
+@pytest.mark.parametrize("literals", [False, True])
+@pytest.mark.parametrize("shard_size", [1, 100, 1000, 10 ** 6])
+def test_shards_match_single_pass(tmpdir, literals, shard_size):
+    path = tmpdir.join("module.js")
+    path.write(make_source(0, 300, literals))
+    document = JavaScriptDocument(str(path), mmap_threshold=1,
+                                  shard_size=shard_size)
+    assert describe(document.parse()) == parse(path)
+    if shard_size < 10 ** 6:
+        assert len(document.get_shards()) > 1
+
+
+def test_shards_in_processes(tmpdir):
+    path = tmpdir.join("module.js")
+    path.write(make_source(1, 300))
+    assert parse(path, shard_size=1000, shard_workers=2) == parse(path)